@@ -49,6 +49,7 @@ class IGSession:
         self.account_id = None
         self.cst_token = None
         self.x_security_token = None
+        self.lightstreamer_endpoint = None
         self.is_authenticated = False
 
     def login(self) -> bool:
@@ -65,7 +66,9 @@ class IGSession:
             if r.status_code == 200:
                 self.cst_token = r.headers["CST"]
                 self.x_security_token = r.headers["X-SECURITY-TOKEN"]
-                self.account_id = r.json().get("accountId")
+                body = r.json()
+                self.account_id = body.get("accountId") or body.get("currentAccountId")
+                self.lightstreamer_endpoint = body.get("lightstreamerEndpoint")
 
                 self.headers["CST"] = self.cst_token
                 self.headers["X-SECURITY-TOKEN"] = self.x_security_token
@@ -90,5 +93,13 @@ class IGSession:
     def get_headers(self):
         return self.headers
 
+    def get_streaming_credentials(self):
+        """(endpoint, user, password) for the Lightstreamer price stream."""
+        return (
+            self.lightstreamer_endpoint,
+            self.account_id,
+            f"CST-{self.cst_token}|XST-{self.x_security_token}",
+        )
+
     def get_base_url(self):
         return self.auth.base_url
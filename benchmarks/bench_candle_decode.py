@@ -0,0 +1,62 @@
+# Benchmarks the old per-row .apply candle path against the columnar decoder,
+# and decode_candles against its per-row fallback and pd.json_normalize.
+# Run from the repo root: python benchmarks/bench_candle_decode.py
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from data_feed.candle_decoder import _row_columns, candles_to_frame, decode_candles
+
+def make_candles(n):
+    t0 = datetime(2024, 1, 1)
+    out = []
+    for i in range(n):
+        b = 7500.0 + (i % 97) * 0.5
+        ts = t0 + timedelta(minutes=i)
+        out.append({
+            "snapshotTime": ts.strftime("%Y/%m/%d %H:%M:%S"),
+            "snapshotTimeUTC": ts.strftime("%Y-%m-%dT%H:%M:%S"),
+            "openPrice": {"bid": b, "ask": b + 1.0, "lastTraded": None},
+            "highPrice": {"bid": b + 2.0, "ask": b + 3.0, "lastTraded": None},
+            "lowPrice": {"bid": b - 2.0, "ask": b - 1.0, "lastTraded": None},
+            "closePrice": {"bid": b + 0.5, "ask": b + 1.5, "lastTraded": None},
+            "lastTradedVolume": 100 + i % 13,
+        })
+    return out
+
+def legacy_frame(candles):
+    df = pd.DataFrame(candles)
+    df['high'] = df['highPrice'].apply(lambda x: float(x.get('bid', float('nan'))))
+    df['low'] = df['lowPrice'].apply(lambda x: float(x.get('bid', float('nan'))))
+    df['open'] = df['openPrice'].apply(lambda x: float(x.get('bid', float('nan'))))
+    df['close'] = df['closePrice'].apply(lambda x: float(x.get('bid', float('nan'))))
+    df['snapshotTime'] = pd.to_datetime(df['snapshotTime'], utc=True)
+    df.set_index('snapshotTime', inplace=True)
+    return df
+
+def main():
+    print(f"{'bars':>8} {'legacy ms':>12} {'columnar ms':>12} {'speedup':>8}")
+    for n in (200, 10_000, 100_000):
+        candles = make_candles(n)
+        reps = max(1, 2000 // max(1, n // 100))
+        old = min(timeit.repeat(lambda: legacy_frame(candles), number=reps, repeat=3)) / reps
+        new = min(timeit.repeat(lambda: candles_to_frame(candles), number=reps, repeat=3)) / reps
+        print(f"{n:>8} {old * 1e3:>12.3f} {new * 1e3:>12.3f} {old / new:>7.1f}x")
+
+    print()
+    print(f"{'bars':>8} {'decode ms':>12} {'per-row ms':>12} {'normalize ms':>13}")
+    for n in (200, 10_000, 100_000):
+        candles = make_candles(n)
+        reps = max(1, 2000 // max(1, n // 100))
+        dec = min(timeit.repeat(lambda: decode_candles(candles), number=reps, repeat=3)) / reps
+        row = min(timeit.repeat(lambda: _row_columns(candles), number=reps, repeat=3)) / reps
+        nz = min(timeit.repeat(lambda: pd.json_normalize(candles), number=1, repeat=1))
+        print(f"{n:>8} {dec * 1e3:>12.3f} {row * 1e3:>12.3f} {nz * 1e3:>13.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# This file builds OHLC bars locally from streamed ticks (or minute candles).
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from data_feed.candle_store import bar_time
+from data_feed.market_data import RES_SECONDS
+
+_MONDAY_OFFSET = 4 * 86400  # 1970-01-01 was a Thursday
+
+def bucket_start(ts: float, resolution: str) -> float:
+    """UTC open time (epoch seconds) of the bar containing ts."""
+    if resolution == "MONTH":
+        d = datetime.fromtimestamp(ts, tz=timezone.utc)
+        return datetime(d.year, d.month, 1, tzinfo=timezone.utc).timestamp()
+    if resolution == "WEEK":
+        return ts - (ts - _MONDAY_OFFSET) % 604800
+    secs = RES_SECONDS[resolution]
+    return ts - ts % secs
+
+def bucket_end(start: float, resolution: str) -> float:
+    if resolution == "MONTH":
+        d = datetime.fromtimestamp(start, tz=timezone.utc)
+        y, m = (d.year + 1, 1) if d.month == 12 else (d.year, d.month + 1)
+        return datetime(y, m, 1, tzinfo=timezone.utc).timestamp()
+    return start + RES_SECONDS[resolution]
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+class _Bar:
+    """A forming bar; to_candle() renders it in IG /prices candle format."""
+    __slots__ = ("start", "end", "bo", "bh", "bl", "bc", "ao", "ah", "al", "ac", "volume")
+
+    def __init__(self, start, end, bo, bh, bl, bc, ao, ah, al, ac, volume):
+        self.start = start
+        self.end = end
+        self.bo, self.bh, self.bl, self.bc = bo, bh, bl, bc
+        self.ao, self.ah, self.al, self.ac = ao, ah, al, ac
+        self.volume = volume
+
+    def update(self, bh, bl, bc, ah, al, ac, volume):
+        if bh is not None:
+            self.bh = bh if self.bh is None or bh > self.bh else self.bh
+            self.bl = bl if self.bl is None or bl < self.bl else self.bl
+            self.bc = bc
+            if self.bo is None:
+                self.bo = bc
+        if ah is not None:
+            self.ah = ah if self.ah is None or ah > self.ah else self.ah
+            self.al = al if self.al is None or al < self.al else self.al
+            self.ac = ac
+            if self.ao is None:
+                self.ao = ac
+        self.volume += volume
+
+    @classmethod
+    def from_candle(cls, start, end, c: Dict) -> "_Bar":
+        o, h = c.get("openPrice") or {}, c.get("highPrice") or {}
+        l, cl = c.get("lowPrice") or {}, c.get("closePrice") or {}
+        return cls(start, end, o.get("bid"), h.get("bid"), l.get("bid"), cl.get("bid"),
+                   o.get("ask"), h.get("ask"), l.get("ask"), cl.get("ask"),
+                   c.get("lastTradedVolume") or 0)
+
+    def to_candle(self) -> Dict:
+        return {
+            "snapshotTimeUTC": _iso(self.start),
+            "openPrice": {"bid": self.bo, "ask": self.ao},
+            "highPrice": {"bid": self.bh, "ask": self.ah},
+            "lowPrice": {"bid": self.bl, "ask": self.al},
+            "closePrice": {"bid": self.bc, "ask": self.ac},
+            "lastTradedVolume": self.volume,
+        }
+
+class BarAggregator:
+    """
+    Maintains bid/ask OHLC bars for every resolution at once.
+
+    Each tick touches one forming bar per resolution, so the cost per tick is
+    constant. When a tick lands in a new bucket the old bar is closed, kept in
+    a bounded history and passed to every add_listener() callback as
+    (epic, resolution, candle). Bars are IG-format candle dicts, so they can be
+    fed straight to candles_to_frame().
+
+    start() runs flush() on a timer, so a quiet market's bar still closes
+    on time. reset() drops everything (call it when the stream drops: the
+    ticks missed meanwhile can never be rebuilt), and contiguous() tells
+    whether a window can be trusted in place of the REST API.
+    """
+    def __init__(self, resolutions: Optional[List[str]] = None, max_bars: int = 1000):
+        self.resolutions = list(resolutions or RES_SECONDS)
+        self.max_bars = int(max_bars)
+        self._current: Dict[Tuple[str, str], _Bar] = {}
+        self._closed: Dict[Tuple[str, str], Deque[Dict]] = {}
+        # First live data per epic since the last reset; bars before it are seeded history.
+        self._live_since: Dict[str, float] = {}
+        self._listeners: List[Callable[[str, str, Dict], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self, fn: Callable[[str, str, Dict], None]) -> None:
+        self._listeners.append(fn)
+
+    def on_tick(self, tick) -> None:
+        """TickCache listener entry point."""
+        self.add_tick(tick.epic, tick.bid, tick.offer, tick.ts)
+
+    def add_tick(self, epic: str, bid: Optional[float], offer: Optional[float], ts: float) -> None:
+        if bid is None and offer is None:
+            return
+        self._add(epic, ts, bid, bid, bid, bid, offer, offer, offer, offer, 1)
+
+    def add_candle(self, epic: str, candle: Dict) -> None:
+        """Folds a finished MINUTE candle into the higher resolutions."""
+        t = bar_time(candle)
+        if t is None:
+            return
+        o, h = candle.get("openPrice") or {}, candle.get("highPrice") or {}
+        l, c = candle.get("lowPrice") or {}, candle.get("closePrice") or {}
+        self._add(epic, t.timestamp(),
+                  o.get("bid"), h.get("bid"), l.get("bid"), c.get("bid"),
+                  o.get("ask"), h.get("ask"), l.get("ask"), c.get("ask"),
+                  candle.get("lastTradedVolume") or 0)
+
+    def _add(self, epic, ts, bo, bh, bl, bc, ao, ah, al, ac, volume) -> None:
+        closed = []
+        with self._lock:
+            self._live_since.setdefault(epic, ts)
+            for res in self.resolutions:
+                key = (epic, res)
+                bar = self._current.get(key)
+                if bar is not None and bar.start <= ts < bar.end:
+                    bar.update(bh, bl, bc, ah, al, ac, volume)
+                    continue
+                if bar is not None and ts < bar.start:
+                    continue  # late tick for an already closed bar
+                start = bucket_start(ts, res)
+                end = bucket_end(start, res)
+                hist = self._history(key)
+                if bar is not None:
+                    candle = bar.to_candle()
+                    hist.append(candle)
+                    closed.append((res, candle))
+                elif hist and hist[-1].get("snapshotTimeUTC") == _iso(start):
+                    # Seeded history ends with the bar now forming; carry it on live.
+                    bar = _Bar.from_candle(start, end, hist.pop())
+                    bar.update(bh, bl, bc, ah, al, ac, volume)
+                    self._current[key] = bar
+                    continue
+                self._current[key] = _Bar(start, end, bo, bh, bl, bc, ao, ah, al, ac, volume)
+        self._emit(epic, closed)
+
+    def flush(self, now: float) -> None:
+        """Closes forming bars whose bucket has ended, for quiet markets with no new ticks."""
+        closed: Dict[str, list] = {}
+        with self._lock:
+            for key, bar in list(self._current.items()):
+                if now >= bar.end:
+                    candle = bar.to_candle()
+                    self._history(key).append(candle)
+                    closed.setdefault(key[0], []).append((key[1], candle))
+                    del self._current[key]
+        for epic, items in closed.items():
+            self._emit(epic, items)
+
+    def start(self, interval: float = 1.0) -> None:
+        """Flushes finished bars every `interval` seconds on a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.wait(interval):
+                try:
+                    self.flush(time.time())
+                except Exception as e:
+                    logging.error(f"Bar flush failed: {e}")
+
+        self._thread = threading.Thread(target=_run, name="bar-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def reset(self, epic: Optional[str] = None) -> None:
+        """Drops forming and closed bars (for one epic, or all), e.g. after a stream disconnect."""
+        with self._lock:
+            for table in (self._current, self._closed):
+                for key in [k for k in table if epic is None or k[0] == epic]:
+                    del table[key]
+            if epic is None:
+                self._live_since.clear()
+            else:
+                self._live_since.pop(epic, None)
+
+    def contiguous(self, epic: str, resolution: str, n: int) -> bool:
+        """
+        False if no live data has arrived since the last reset, or if the
+        last n bars have a hole nobody watched: a jump from
+        seeded history to live bars that skips buckets. Holes inside the
+        seeded history (the market was shut) or while live data was flowing
+        (no ticks, so no bar) are genuine and do not count.
+        """
+        key = (epic, resolution)
+        with self._lock:
+            since = self._live_since.get(epic)
+            out = list(self._closed.get(key, ()))
+            bar = self._current.get(key)
+            if bar is not None:
+                out.append(bar.to_candle())
+        if since is None:
+            return False  # nothing live since the last reset: the bars would never move
+        live = bucket_start(since, resolution)
+        times = [bar_time(c).timestamp() for c in out[-int(n):]]
+        for prev, cur in zip(times, times[1:]):
+            if bucket_end(prev, resolution) < live <= cur:
+                return False
+        return True
+
+    def seed(self, epic: str, resolution: str, candles: List[Dict]) -> None:
+        """Loads closed history (e.g. from the REST API) older than the forming bar."""
+        key = (epic, resolution)
+        with self._lock:
+            bar = self._current.get(key)
+            hist = self._history(key)
+            hist.clear()
+            for c in candles:
+                t = bar_time(c)
+                if t is None or (bar is not None and t.timestamp() >= bar.start):
+                    continue
+                hist.append(c)
+
+    def bars(self, epic: str, resolution: str, n: int, include_forming: bool = True) -> List[Dict]:
+        key = (epic, resolution)
+        with self._lock:
+            out = list(self._closed.get(key, ()))
+            bar = self._current.get(key)
+            if include_forming and bar is not None:
+                out.append(bar.to_candle())
+        return out[-int(n):] if n else out
+
+    def count(self, epic: str, resolution: str) -> int:
+        key = (epic, resolution)
+        with self._lock:
+            return len(self._closed.get(key, ())) + (1 if key in self._current else 0)
+
+    def _history(self, key) -> Deque[Dict]:
+        hist = self._closed.get(key)
+        if hist is None:
+            hist = self._closed[key] = deque(maxlen=self.max_bars)
+        return hist
+
+    def _emit(self, epic: str, closed: List[Tuple[str, Dict]]) -> None:
+        for res, candle in closed:
+            for fn in self._listeners:
+                try:
+                    fn(epic, res, candle)
+                except Exception as e:
+                    logging.error(f"Bar close listener error for {epic} {res}: {e}")
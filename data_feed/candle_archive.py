@@ -0,0 +1,113 @@
+# This file keeps an append-only on-disk candle history per (epic, resolution).
+import os
+import re
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from data_feed.candle_decoder import decode_candles
+
+# One raw little-endian file per column, so a window of any column is a
+# zero-copy np.memmap slice.
+COLUMNS = {
+    "time": "<i8",  # bar open time, epoch seconds UTC
+    "bid_open": "<f8", "bid_high": "<f8", "bid_low": "<f8", "bid_close": "<f8",
+    "ask_open": "<f8", "ask_high": "<f8", "ask_low": "<f8", "ask_close": "<f8",
+    "volume": "<f8",
+}
+
+def _safe_name(text: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", text)
+
+class CandleArchive:
+    """
+    Append-only columnar candle files under root/<epic>/<resolution>/<column>.
+
+    Only bars newer than the last archived bar are appended. If a crash leaves
+    the column files at different lengths, the shortest length wins and the
+    longer files are trimmed on the next append.
+    """
+    def __init__(self, root: str = "candle_archive"):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _dir(self, epic: str, resolution: str) -> str:
+        return os.path.join(self.root, _safe_name(epic), _safe_name(resolution))
+
+    def _path(self, epic: str, resolution: str, col: str) -> str:
+        return os.path.join(self._dir(epic, resolution), col)
+
+    def count(self, epic: str, resolution: str) -> int:
+        sizes = []
+        for col, dt in COLUMNS.items():
+            p = self._path(epic, resolution, col)
+            if not os.path.exists(p):
+                return 0
+            sizes.append(os.path.getsize(p) // np.dtype(dt).itemsize)
+        return min(sizes)
+
+    def last_time(self, epic: str, resolution: str) -> Optional[datetime]:
+        n = self.count(epic, resolution)
+        if n == 0:
+            return None
+        t = np.memmap(self._path(epic, resolution, "time"), dtype=COLUMNS["time"], mode="r", shape=(n,))
+        return datetime.fromtimestamp(int(t[-1]), tz=timezone.utc)
+
+    def window(self, epic: str, resolution: str, n: int) -> Dict[str, np.ndarray]:
+        """Read-only memmap views of the last n bars (fewer if the archive is shorter)."""
+        total = self.count(epic, resolution)
+        start = max(0, total - int(n)) if n else 0
+        out = {}
+        for col, dt in COLUMNS.items():
+            if total == 0:
+                out[col] = np.empty(0, dtype=dt)
+                continue
+            m = np.memmap(self._path(epic, resolution, col), dtype=dt, mode="r", shape=(total,))
+            out[col] = m[start:]
+        return out
+
+    def append_candles(self, epic: str, resolution: str, candles: List[Dict]) -> int:
+        """Archives IG candle dicts; returns the number of bars written."""
+        if not candles:
+            return 0
+        cols = decode_candles(candles)
+        cols["time"] = cols["time"].astype("datetime64[s]").astype(np.int64)
+        return self.append(epic, resolution, cols)
+
+    def append(self, epic: str, resolution: str, cols: Dict[str, np.ndarray]) -> int:
+        times = np.asarray(cols["time"], dtype=np.int64)
+        with self._lock:
+            d = self._dir(epic, resolution)
+            os.makedirs(d, exist_ok=True)
+            n = self.count(epic, resolution)
+            self._trim(epic, resolution, n)
+            if n:
+                last = np.memmap(self._path(epic, resolution, "time"), dtype=COLUMNS["time"],
+                                 mode="r", shape=(n,))[-1]
+                keep = times > last
+            else:
+                keep = np.ones(len(times), dtype=bool)
+            # Bars must stay time-ordered for window reads.
+            keep &= np.concatenate(([True], np.diff(times) > 0)) if len(times) else keep
+            written = int(keep.sum())
+            if written == 0:
+                return 0
+            for col, dt in COLUMNS.items():
+                arr = np.ascontiguousarray(np.asarray(cols[col])[keep], dtype=dt)
+                with open(self._path(epic, resolution, col), "ab") as f:
+                    f.write(arr.tobytes())
+            return written
+
+    def _trim(self, epic: str, resolution: str, n: int) -> None:
+        for col, dt in COLUMNS.items():
+            p = self._path(epic, resolution, col)
+            if not os.path.exists(p):
+                continue
+            want = n * np.dtype(dt).itemsize
+            if os.path.getsize(p) != want:
+                logging.warning(f"Trimming archive column {p} to {n} bars")
+                with open(p, "r+b") as f:
+                    f.truncate(want)
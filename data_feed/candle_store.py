@@ -0,0 +1,112 @@
+# This file keeps a bounded window of recent candles per (epic, resolution).
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+def bar_time(candle: Dict) -> Optional[datetime]:
+    """Parses the UTC open time of an IG candle (v3 or v2 timestamp formats)."""
+    raw = candle.get("snapshotTimeUTC") or candle.get("snapshotTime")
+    if not raw:
+        return None
+    raw = raw.replace("/", "-").replace(" ", "T").rstrip("Z")
+    try:
+        return datetime.fromisoformat(raw).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def bid_price(candle: Dict, field: str) -> Optional[float]:
+    """Bid side of one of a candle's price blocks (e.g. "highPrice") as a float."""
+    v = (candle.get(field) or {}).get("bid")
+    return float(v) if v is not None else None
+
+class CandleStore:
+    """
+    Holds the raw IG candle dicts for each (epic, resolution), in time order.
+
+    New bars are merged by open time, so re-fetching the last (still forming)
+    bar replaces it rather than duplicating it. Each key is trimmed to the
+    largest window that has been asked for.
+
+    mark_synced() records when the API was last asked for a key and how
+    many fetches in a row brought nothing new, so callers can tell a
+    closed market from a store that has fallen behind.
+    """
+    def __init__(self):
+        self._bars: Dict[Tuple[str, str], List[Dict]] = {}
+        self._capacity: Dict[Tuple[str, str], int] = {}
+        self._synced: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def last_time(self, epic: str, resolution: str) -> Optional[datetime]:
+        with self._lock:
+            bars = self._bars.get((epic, resolution))
+            if not bars:
+                return None
+            return bar_time(bars[-1])
+
+    def size(self, epic: str, resolution: str) -> int:
+        with self._lock:
+            return len(self._bars.get((epic, resolution), []))
+
+    def capacity(self, epic: str, resolution: str) -> int:
+        with self._lock:
+            return self._capacity.get((epic, resolution), 0)
+
+    def replace(self, epic: str, resolution: str, candles: List[Dict], capacity: int) -> None:
+        key = (epic, resolution)
+        with self._lock:
+            self._capacity[key] = max(int(capacity), self._capacity.get(key, 0))
+            self._bars[key] = list(candles)[-self._capacity[key]:]
+
+    def merge(self, epic: str, resolution: str, candles: List[Dict]) -> int:
+        """Appends candles newer than the stored tail; returns how many were new."""
+        key = (epic, resolution)
+        with self._lock:
+            bars = self._bars.setdefault(key, [])
+            added = 0
+            for c in candles:
+                t = bar_time(c)
+                if t is None:
+                    continue
+                # Walk back over the (few) tail bars this one might overwrite.
+                j = len(bars)
+                while j > 0 and bar_time(bars[j - 1]) > t:
+                    j -= 1
+                if j > 0 and bar_time(bars[j - 1]) == t:
+                    bars[j - 1] = c
+                else:
+                    bars.insert(j, c)
+                    added += 1
+            cap = self._capacity.get(key, 0)
+            if cap and len(bars) > cap:
+                del bars[:len(bars) - cap]
+            return added
+
+    def synced(self, epic: str, resolution: str) -> Tuple[Optional[float], int]:
+        """(time.time() of the last fetch, consecutive fetches that brought nothing new)."""
+        with self._lock:
+            return self._synced.get((epic, resolution), (None, 0))
+
+    def mark_synced(self, epic: str, resolution: str, changed: bool) -> None:
+        key = (epic, resolution)
+        with self._lock:
+            quiet = 0 if changed else self._synced.get(key, (None, 0))[1] + 1
+            self._synced[key] = (time.time(), quiet)
+
+    def window(self, epic: str, resolution: str, max_points: int) -> List[Dict]:
+        with self._lock:
+            bars = self._bars.get((epic, resolution), [])
+            return bars[-int(max_points):] if max_points else list(bars)
+
+    def clear(self, epic: Optional[str] = None) -> None:
+        with self._lock:
+            if epic is None:
+                self._bars.clear()
+                self._capacity.clear()
+                self._synced.clear()
+                return
+            for key in [k for k in self._bars if k[0] == epic]:
+                self._bars.pop(key, None)
+                self._capacity.pop(key, None)
+                self._synced.pop(key, None)
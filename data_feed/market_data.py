@@ -6,51 +6,183 @@ import pandas as pd
 from requests import Timeout, RequestException
 import json
 
+from datetime import datetime, timezone
+
+from data_feed.snapshot_cache import SnapshotCache
+from data_feed.candle_store import CandleStore
+from data_feed.candle_decoder import candles_to_frame, columns_to_candles
+
+RES_MAP = {
+    "MINUTE": "MINUTE",
+    "MINUTE_2": "MINUTE_2",
+    "MINUTE_3": "MINUTE_3",
+    "MINUTE_5": "MINUTE_5",
+    "MINUTE_10": "MINUTE_10",
+    "MINUTE_15": "MINUTE_15",
+    "MINUTE_30": "MINUTE_30",
+    "HOUR": "HOUR",
+    "HOUR_2": "HOUR_2",
+    "HOUR_3": "HOUR_3",
+    "HOUR_4": "HOUR_4",
+    "DAY": "DAY",
+    "WEEK": "WEEK",
+    "MONTH": "MONTH",
+}
+
+# Nominal bar length per resolution (MONTH is approximate).
+RES_SECONDS = {
+    "MINUTE": 60,
+    "MINUTE_2": 120,
+    "MINUTE_3": 180,
+    "MINUTE_5": 300,
+    "MINUTE_10": 600,
+    "MINUTE_15": 900,
+    "MINUTE_30": 1800,
+    "HOUR": 3600,
+    "HOUR_2": 7200,
+    "HOUR_3": 10800,
+    "HOUR_4": 14400,
+    "DAY": 86400,
+    "WEEK": 604800,
+    "MONTH": 2678400,
+}
+
+IG_TIME_FMT = "%Y-%m-%dT%H:%M:%S"
+
+# After fetches that brought nothing new (market closed or quiet), the next
+# tail fetch waits 2**n bars, up to this many.
+QUIET_MAX_BARS = 60
+
+# GET /markets?epics= accepts at most this many epics per request.
+MAX_EPICS_PER_REQUEST = 50
+
 class MarketData:
-    def __init__(self, session, headers, base_url):
+    def __init__(self, session, headers, base_url, price_ttl: float = 1.0, rules_ttl: float = 300.0,
+                 archive=None):
         self.session = session
         self.headers = headers
         self.base_url = base_url
+        self.cache = SnapshotCache(price_ttl=price_ttl, rules_ttl=rules_ttl)
+        self.candles = CandleStore()
+        self.ticks = None  # TickCache, set by attach_tick_cache()
+        self.bars = None  # BarAggregator, set by attach_bar_aggregator()
+        self.archive = archive  # optional CandleArchive for on-disk history
+
+    def attach_tick_cache(self, tick_cache) -> None:
+        """Serves bid/offer from a streaming TickCache whenever it has a fresh tick."""
+        self.ticks = tick_cache
+
+    def attach_bar_aggregator(self, aggregator) -> None:
+        """Serves candle windows from locally aggregated bars once enough have built up."""
+        self.bars = aggregator
+
+    def _live_tick(self, epic):
+        if self.ticks is None:
+            return None
+        tick = self.ticks.get(epic)
+        if tick is None or tick.bid is None or tick.offer is None:
+            return None
+        return tick
 
-    def get_market_details(self, epic) -> tuple:
+    def fetch_market(self, epic) -> Optional[Dict]:
+        """Full GET /markets/{epic}; refreshes both halves of the snapshot cache."""
         headers = self.headers.copy()
         headers["Version"] = "3"
         r = self.session.get(f"{self.base_url}/markets/{epic}", headers=headers)
         if r.status_code == 200:
             data = r.json()
-            return (
-                data["dealingRules"]["minDealSize"]["value"],
-                data["instrument"]["marginFactor"],
-                data["snapshot"]["bid"],
-                data["snapshot"]["offer"]
-            )
-        return 0, 0, None, None
+            self.cache.put_market(epic, data)
+            return data
+        return None
+
+    def get_market_details(self, epic, refresh: bool = False) -> tuple:
+        """
+        Returns (minDealSize, marginFactor, bid, offer), served from the
+        snapshot cache while it is fresh. refresh=True forces a new GET.
+        """
+        if refresh:
+            self.cache.invalidate(epic, prices_only=True)
+        tick = None if refresh else self._live_tick(epic)
+        if tick is not None:
+            rules = self.cache.get_rules(epic)
+            if rules is not None:
+                return (
+                    rules["dealingRules"]["minDealSize"]["value"],
+                    rules["instrument"]["marginFactor"],
+                    tick.bid,
+                    tick.offer
+                )
+        snap, rules = self.cache.lookup(epic)
+        if snap is None or rules is None:
+            data = self.fetch_market(epic)
+            if data is None:
+                return 0, 0, None, None
+            snap = data["snapshot"]
+            rules = {"dealingRules": data["dealingRules"], "instrument": data["instrument"]}
+        return (
+            rules["dealingRules"]["minDealSize"]["value"],
+            rules["instrument"]["marginFactor"],
+            snap["bid"],
+            snap["offer"]
+        )
+
+    def get_market_snapshots(self, epics: List[str], refresh: bool = False) -> Dict[str, Dict]:
+        """
+        Returns {epic: market details} for a whole watchlist. Epics with a fresh
+        cache entry are served locally; the rest are fetched with bulk
+        GET /markets?epics=... requests of up to 50 epics each.
+        """
+        out: Dict[str, Dict] = {}
+        missing = []
+        for epic in dict.fromkeys(epics):
+            if refresh:
+                missing.append(epic)
+                continue
+            snap, rules = self.cache.lookup(epic)
+            if snap is not None and rules is not None:
+                out[epic] = {"snapshot": snap, **rules}
+            else:
+                missing.append(epic)
+
+        headers = self.headers.copy()
+        headers["Version"] = "2"
+        for i in range(0, len(missing), MAX_EPICS_PER_REQUEST):
+            chunk = missing[i:i + MAX_EPICS_PER_REQUEST]
+            try:
+                r = self.session.get(f"{self.base_url}/markets", headers=headers,
+                                     params={"epics": ",".join(chunk)})
+                if r.status_code != 200:
+                    logging.warning(f"Bulk market fetch failed: {r.status_code} {r.text}")
+                    continue
+                for data in (r.json() or {}).get("marketDetails", []):
+                    epic = (data.get("instrument") or {}).get("epic")
+                    if epic:
+                        self.cache.put_market(epic, data)
+                        out[epic] = data
+            except (Timeout, RequestException) as e:
+                logging.error(f"Error fetching bulk market details: {e}")
+        return out
+
+    def invalidate(self, epic: Optional[str] = None) -> None:
+        self.cache.invalidate(epic)
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.cache.stats()
         
-    def get_prices(self, epic, resolution="MINUTE", max_points=200) -> Optional[List[Dict]]:
+    def get_prices(self, epic, resolution="MINUTE", max_points=200,
+                   from_time: Optional[datetime] = None, to_time: Optional[datetime] = None) -> Optional[List[Dict]]:
         headers = self.headers.copy()
         headers["Version"] = "3"
-        
-        RES_MAP = {
-            "MINUTE": "MINUTE",
-            "MINUTE_2": "MINUTE_2",
-            "MINUTE_3": "MINUTE_3",
-            "MINUTE_5": "MINUTE_5",
-            "MINUTE_10": "MINUTE_10",
-            "MINUTE_15": "MINUTE_15",
-            "MINUTE_30": "MINUTE_30",
-            "HOUR": "HOUR",
-            "HOUR_2": "HOUR_2",
-            "HOUR_3": "HOUR_3",
-            "HOUR_4": "HOUR_4",
-            "DAY": "DAY",
-            "WEEK": "WEEK",
-            "MONTH": "MONTH",
-        }
-        
+
         res = RES_MAP.get(resolution, "MINUTE")
 
-        url = f"{self.base_url}/prices/{epic}?resolution={res}&max_points={max_points}"
-        
+        if from_time is not None:
+            to_time = to_time or datetime.now(timezone.utc)
+            url = (f"{self.base_url}/prices/{epic}?resolution={res}"
+                   f"&from={from_time.strftime(IG_TIME_FMT)}&to={to_time.strftime(IG_TIME_FMT)}&pageSize=0")
+        else:
+            url = f"{self.base_url}/prices/{epic}?resolution={res}&max_points={max_points}"
+
         try:
             r = self.session.get(url, headers=headers)
             if r.status_code == 200:
@@ -62,28 +194,100 @@ class MarketData:
             logging.error(f"Error fetching prices for {epic}: {e}")
             return []
 
+    def get_price_window(self, epic, resolution="MINUTE", max_points=200, max_age: float = 0.0) -> List[Dict]:
+        """
+        Returns the last max_points candles from the local candle store,
+        fetching only the bars since the stored tail. An empty or too short
+        store is first filled from the on-disk archive (when there is one),
+        else by a full window download; so is a store last synced more than
+        max_points bars ago. How far behind the store is counts from its
+        last fetch, not from its last bar, so a closed market does not
+        trigger full downloads; while tail fetches keep bringing nothing
+        new, they are spaced out (see QUIET_MAX_BARS). A window fetched
+        less than max_age seconds ago is served as it is.
+        """
+        res = RES_MAP.get(resolution, "MINUTE")
+        if (self.bars is not None and self.bars.count(epic, res) >= max_points
+                and self.bars.contiguous(epic, res, max_points)):
+            return self.bars.bars(epic, res, max_points)
+
+        last = self.candles.last_time(epic, res)
+        synced_at, quiet = self.candles.synced(epic, res)
+        now = datetime.now(timezone.utc)
+        behind = None
+        if synced_at is not None:
+            behind = (now.timestamp() - synced_at) / RES_SECONDS[res]
+
+        stale = last is None or self.candles.capacity(epic, res) < max_points or behind is None or behind > max_points
+        if stale and self._load_archive(epic, res, max_points, now):
+            last, quiet, stale = self.candles.last_time(epic, res), 0, False
+        if stale:
+            candles = self.get_prices(epic, resolution=res, max_points=max_points)
+            if candles:
+                self.candles.replace(epic, res, candles, max_points)
+                self.candles.mark_synced(epic, res, True)
+                self._archive(epic, res, candles)
+                if self.bars is not None:
+                    # Seed local bars so later windows can be served without the API.
+                    self.bars.seed(epic, res, candles)
+            return self.candles.window(epic, res, max_points)
+
+        if behind is not None and (behind * RES_SECONDS[res] < max_age or
+                                   (quiet and behind < min(2 ** quiet, QUIET_MAX_BARS, max(1, max_points // 2)))):
+            return self.candles.window(epic, res, max_points)
+
+        # Re-fetch from the stored tail so the still-forming bar is refreshed too.
+        tail = self.candles.window(epic, res, 1)
+        candles = self.get_prices(epic, resolution=res, from_time=last, to_time=now)
+        changed = False
+        if candles:
+            changed = self.candles.merge(epic, res, candles) > 0 or candles[-1] != tail[-1]
+            if changed:
+                self._archive(epic, res, candles)
+        self.candles.mark_synced(epic, res, changed)
+        window = self.candles.window(epic, res, max_points)
+        if self.bars is not None and window:
+            # Re-seed so local bars can take over again, e.g. after a stream drop reset them.
+            self.bars.seed(epic, res, window)
+        return window
+
+    def _archive(self, epic: str, res: str, candles: List[Dict]) -> None:
+        # The last bar may still be forming; it is archived once a newer one exists.
+        if self.archive is not None and len(candles) > 1:
+            self.archive.append_candles(epic, res, candles[:-1])
+
+    def _load_archive(self, epic: str, res: str, max_points: int, now: datetime) -> bool:
+        """
+        Fills the candle store from the on-disk archive, so a restart only
+        has to fetch the bars since its last entry. False when there is no
+        archive, or it is too short or too far behind to be worth a tail fetch.
+        """
+        # The forming bar is never archived; the tail fetch that follows brings it.
+        if self.archive is None or self.archive.count(epic, res) < max_points - 1:
+            return False
+        last = self.archive.last_time(epic, res)
+        if (now - last).total_seconds() / RES_SECONDS[res] > max_points:
+            return False
+        self.candles.replace(epic, res, columns_to_candles(self.archive.window(epic, res, max_points)), max_points)
+        return True
+
     def get_mid_price(self, epic: str) -> Optional[float]:
+        tick = self._live_tick(epic)
+        if tick is not None:
+            return tick.mid
         _, _, bid, offer = self.get_market_details(epic)
         if bid is not None and offer is not None:
             return (float(bid) + float(offer)) / 2.0
         return None
 
-    def get_candles(self, epic: str, resolution: str, max_bars: int) -> Optional[pd.DataFrame]:
+    def get_candles(self, epic: str, resolution: str, max_bars: int, max_age: float = 0.0) -> Optional[pd.DataFrame]:
         """
-        Fetches candlestick data and returns a pandas DataFrame.
+        Fetches candlestick data and returns a pandas DataFrame indexed by
+        snapshotTime. open/high/low/close are bid prices; bid_*, ask_*, mid_*
+        and volume columns are also included. Served from the same per
+        (epic, resolution) window as get_price_window; max_age as there.
         """
-        candles = self.get_prices(epic, resolution=resolution, max_points=max_bars)
+        candles = self.get_price_window(epic, resolution=resolution, max_points=max_bars, max_age=max_age)
         if not candles:
             return None
-        
-        df = pd.DataFrame(candles)
-        
-        df['high'] = df['highPrice'].apply(lambda x: float(x.get('bid', float('nan'))))
-        df['low'] = df['lowPrice'].apply(lambda x: float(x.get('bid', float('nan'))))
-        df['open'] = df['openPrice'].apply(lambda x: float(x.get('bid', float('nan'))))
-        df['close'] = df['closePrice'].apply(lambda x: float(x.get('bid', float('nan'))))
-        
-        df['snapshotTime'] = pd.to_datetime(df['snapshotTime'], utc=True)
-        df.set_index('snapshotTime', inplace=True)
-        
-        return df
+        return candles_to_frame(candles)
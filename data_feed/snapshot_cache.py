@@ -0,0 +1,84 @@
+# This file holds the per-epic market snapshot cache used by MarketData.
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class SnapshotCache:
+    """
+    Caches the parts of a GET /markets/{epic} response per epic.
+
+    Bid/offer (the "snapshot" block) goes stale quickly, while the dealing
+    rules and instrument block change rarely, so each has its own TTL.
+    """
+    def __init__(self, price_ttl: float = 1.0, rules_ttl: float = 300.0):
+        self.price_ttl = float(price_ttl)
+        self.rules_ttl = float(rules_ttl)
+        self._prices: Dict[str, Tuple[float, Dict]] = {}
+        self._rules: Dict[str, Tuple[float, Dict]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, table, epic, ttl) -> Optional[Dict]:
+        entry = table.get(epic)
+        if entry is None:
+            return None
+        ts, value = entry
+        if time.monotonic() - ts > ttl:
+            return None
+        return value
+
+    def get_snapshot(self, epic: str) -> Optional[Dict]:
+        with self._lock:
+            return self._fresh(self._prices, epic, self.price_ttl)
+
+    def get_rules(self, epic: str) -> Optional[Dict]:
+        with self._lock:
+            return self._fresh(self._rules, epic, self.rules_ttl)
+
+    def lookup(self, epic: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Returns (snapshot, rules) and counts a hit only if both are fresh."""
+        with self._lock:
+            snap = self._fresh(self._prices, epic, self.price_ttl)
+            rules = self._fresh(self._rules, epic, self.rules_ttl)
+            if snap is not None and rules is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return snap, rules
+
+    def put_snapshot(self, epic: str, snapshot: Dict) -> None:
+        with self._lock:
+            self._prices[epic] = (time.monotonic(), snapshot)
+
+    def put_rules(self, epic: str, rules: Dict) -> None:
+        with self._lock:
+            self._rules[epic] = (time.monotonic(), rules)
+
+    def put_market(self, epic: str, data: Dict) -> None:
+        """Stores a full /markets/{epic} payload."""
+        now = time.monotonic()
+        with self._lock:
+            self._prices[epic] = (now, data.get("snapshot") or {})
+            self._rules[epic] = (now, {
+                "dealingRules": data.get("dealingRules") or {},
+                "instrument": data.get("instrument") or {},
+            })
+
+    def invalidate(self, epic: Optional[str] = None, prices_only: bool = False) -> None:
+        """Drops cached entries for one epic, or for every epic if none given."""
+        with self._lock:
+            if epic is None:
+                self._prices.clear()
+                if not prices_only:
+                    self._rules.clear()
+                return
+            self._prices.pop(epic, None)
+            if not prices_only:
+                self._rules.pop(epic, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "epics": len(set(self._prices) | set(self._rules))}
@@ -0,0 +1,166 @@
+# This file is a local stand-in for the IG Lightstreamer server, for testing the
+# streaming client without a live account.
+import threading
+import uuid
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue, Empty
+from typing import Dict, Optional
+from urllib.parse import parse_qs, quote
+
+class _StreamSession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.queue: "Queue[Optional[str]]" = Queue()
+        # sub_id -> (items, fields)
+        self.subs: Dict[int, tuple] = {}
+
+class LocalStreamServer:
+    """
+    Speaks the subset of TLCP that LightstreamerClient uses: create_session
+    (streamed CONOK/U/PROBE lines), control add/delete (REQOK + SUBOK).
+
+        server = LocalStreamServer().start()
+        client = LightstreamerClient(server.url, "user", "pass")
+        server.push("MARKET:IX.D.FTSE.DAILY.IP", {"BID": "7500.1", "OFFER": "7501.1"})
+        server.drop_sessions()   # simulate a disconnect
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, probe_interval: float = 1.0):
+        self.probe_interval = probe_interval
+        self.sessions: Dict[str, _StreamSession] = {}
+        self.sessions_created = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "LocalStreamServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="ls-local", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.drop_sessions()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def push(self, item: str, values: Dict[str, Optional[str]]) -> int:
+        """Sends an update for item to every subscribed session; returns how many got it."""
+        sent = 0
+        with self._lock:
+            sessions = list(self.sessions.values())
+        for s in sessions:
+            for sub_id, (items, fields) in list(s.subs.items()):
+                if item not in items:
+                    continue
+                encoded = []
+                for f in fields:
+                    if f not in values:
+                        encoded.append("")
+                    elif values[f] is None:
+                        encoded.append("#")
+                    elif values[f] == "":
+                        encoded.append("$")
+                    else:
+                        encoded.append(quote(str(values[f]), safe=".:-"))
+                s.queue.put(f"U,{sub_id},{items.index(item) + 1},{'|'.join(encoded)}")
+                sent += 1
+        return sent
+
+    def drop_sessions(self) -> None:
+        with self._lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for s in sessions:
+            s.queue.put(None)
+
+    def subscribed(self, item: str) -> bool:
+        with self._lock:
+            sessions = list(self.sessions.values())
+        return any(item in items for s in sessions for items, _ in s.subs.values())
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):
+                logging.debug("local stream server: " + fmt % args)
+
+            def _form(self) -> Dict[str, str]:
+                n = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(n).decode() if n else ""
+                return {k: v[0] for k, v in parse_qs(body, keep_blank_values=True).items()}
+
+            def do_POST(self):
+                path = self.path.split("?", 1)[0]
+                if path.endswith("/create_session.txt"):
+                    self._create_session(self._form())
+                elif path.endswith("/control.txt"):
+                    self._control(self._form())
+                else:
+                    self.send_error(404)
+
+            def _create_session(self, form):
+                s = _StreamSession(uuid.uuid4().hex[:12])
+                with server._lock:
+                    server.sessions[s.session_id] = s
+                    server.sessions_created += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self._write(f"CONOK,{s.session_id},50000,{int(server.probe_interval * 1000)},*")
+                while True:
+                    try:
+                        line = s.queue.get(timeout=server.probe_interval)
+                    except Empty:
+                        line = "PROBE"
+                    if line is None:
+                        break
+                    try:
+                        self._write(line)
+                    except OSError:
+                        break
+                try:
+                    self.wfile.write(b"0\r\n\r\n")
+                except OSError:
+                    pass
+                self.close_connection = True
+
+            def _write(self, line: str):
+                data = (line + "\r\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def _control(self, form):
+                with server._lock:
+                    s = server.sessions.get(form.get("LS_session", ""))
+                req_id = form.get("LS_reqId", "0")
+                if s is None:
+                    reply = f"REQERR,{req_id},20,Session not found"
+                else:
+                    sub_id = int(form.get("LS_subId", "0"))
+                    if form.get("LS_op") == "add":
+                        items = form.get("LS_group", "").split()
+                        fields = form.get("LS_schema", "").split()
+                        s.subs[sub_id] = (items, fields)
+                        s.queue.put(f"SUBOK,{sub_id},{len(items)},{len(fields)}")
+                    elif form.get("LS_op") == "delete":
+                        s.subs.pop(sub_id, None)
+                        s.queue.put(f"UNSUB,{sub_id}")
+                    reply = f"REQOK,{req_id}"
+                data = (reply + "\r\n").encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,345 @@
+# This file is the streaming price client (Lightstreamer TLCP over HTTP).
+import json
+import threading
+import logging
+from typing import Callable, Dict, List, Optional
+from urllib.parse import unquote
+
+import requests
+from requests import RequestException
+
+from data_feed.tick_cache import TickCache
+
+TLCP_VERSION = "TLCP-2.4.0"
+# Generic client id accepted by Lightstreamer servers for custom clients.
+LS_CID = "mgQkwtwdysogQz2BJ4Ji kOj2Bg"
+
+def decode_update(raw: str, previous: List[Optional[str]]) -> List[Optional[str]]:
+    """
+    Decodes the value part of a TLCP "U" line against the previous values.
+    ""=unchanged, "#"=null, "$"=empty string, "^N"=next N fields unchanged,
+    anything else is percent-encoded text.
+    """
+    out: List[Optional[str]] = []
+    for token in raw.split("|"):
+        i = len(out)
+        if token == "":
+            out.append(previous[i] if i < len(previous) else None)
+        elif token == "#":
+            out.append(None)
+        elif token == "$":
+            out.append("")
+        elif token.startswith("^") and token[1:].isdigit():
+            for k in range(int(token[1:])):
+                j = i + k
+                out.append(previous[j] if j < len(previous) else None)
+        else:
+            out.append(unquote(token))
+    return out
+
+class Subscription:
+    def __init__(self, sub_id: int, items: List[str], fields: List[str], mode: str,
+                 listener: Callable[[str, Dict[str, Optional[str]]], None]):
+        self.sub_id = sub_id
+        self.items = list(items)
+        self.fields = list(fields)
+        self.mode = mode
+        self.listener = listener
+        # Last decoded values per item index (1-based, as on the wire).
+        self.values: Dict[int, List[Optional[str]]] = {}
+
+class LightstreamerClient:
+    """
+    Minimal TLCP client: one streaming connection, subscriptions sent over
+    control requests, automatic reconnect with exponential backoff.
+    Subscriptions survive reconnects and are re-sent on every new session.
+    """
+    def __init__(self, endpoint: str, user: str, password: str, adapter_set: str = "DEFAULT",
+                 reconnect_delay: float = 1.0, max_reconnect_delay: float = 30.0,
+                 read_timeout: float = 30.0):
+        self.endpoint = endpoint.rstrip("/")
+        self.user = user
+        self.password = password
+        self.adapter_set = adapter_set
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.read_timeout = read_timeout
+        # A dedicated HTTP session so the long-lived stream never ties up the REST pool.
+        self.http = requests.Session()
+        self.session_id: Optional[str] = None
+        self.control_url: Optional[str] = None
+        self.connected = threading.Event()
+        self.reconnects = 0
+        self.on_disconnect: Optional[Callable[[], None]] = None
+        # Called with a Subscription the server would not take (control request refused).
+        self.on_subscription_error: Optional[Callable[[Subscription], None]] = None
+
+        self._subs: Dict[int, Subscription] = {}
+        self._next_sub = 1
+        self._next_req = 1
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._response = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ls-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        resp = self._response
+        if resp is not None:
+            try:
+                resp.close()
+            except Exception:
+                pass
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.connected.clear()
+
+    def subscribe(self, items: List[str], fields: List[str],
+                  listener: Callable[[str, Dict[str, Optional[str]]], None], mode: str = "MERGE") -> int:
+        with self._lock:
+            sub = Subscription(self._next_sub, items, fields, mode, listener)
+            self._next_sub += 1
+            self._subs[sub.sub_id] = sub
+        if self.connected.is_set():
+            self._send_subscribe(sub)
+        return sub.sub_id
+
+    def unsubscribe(self, sub_id: int) -> None:
+        with self._lock:
+            sub = self._subs.pop(sub_id, None)
+        if sub is not None and self.connected.is_set():
+            self._control({"LS_op": "delete", "LS_subId": str(sub_id)})
+
+    def _run(self) -> None:
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            try:
+                if self._stream_once():
+                    delay = self.reconnect_delay
+            except (RequestException, OSError) as e:
+                if not self._stop.is_set():
+                    logging.warning(f"Stream connection error: {e}")
+            except Exception as e:
+                # stop() closes the response under the reader, which surfaces here.
+                if not self._stop.is_set():
+                    logging.error(f"Stream error: {e}")
+            self._disconnected()
+            if self._stop.is_set():
+                break
+            self.reconnects += 1
+            logging.info(f"Reconnecting price stream in {delay:.1f}s")
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    def _disconnected(self) -> None:
+        was_connected = self.connected.is_set()
+        self.connected.clear()
+        self.session_id = None
+        self._response = None
+        if was_connected and self.on_disconnect:
+            try:
+                self.on_disconnect()
+            except Exception as e:
+                logging.error(f"on_disconnect error: {e}")
+
+    def _stream_once(self) -> bool:
+        """Runs one streaming session; returns True if it got as far as CONOK."""
+        body = {
+            "LS_user": self.user,
+            "LS_password": self.password,
+            "LS_adapter_set": self.adapter_set,
+            "LS_cid": LS_CID,
+        }
+        r = self.http.post(f"{self.endpoint}/lightstreamer/create_session.txt",
+                           params={"LS_protocol": TLCP_VERSION}, data=body,
+                           stream=True, timeout=(10, self.read_timeout))
+        self._response = r
+        if r.status_code != 200:
+            logging.warning(f"Stream create_session failed: {r.status_code}")
+            r.close()
+            return False
+        ok = False
+        try:
+            for line in r.iter_lines(decode_unicode=True):
+                if self._stop.is_set():
+                    break
+                if not line:
+                    continue
+                if self._handle_line(line):
+                    ok = True
+                if line.startswith(("END", "CONERR", "LOOP", "ERROR")):
+                    break
+        finally:
+            r.close()
+        return ok
+
+    def _handle_line(self, line: str) -> bool:
+        parts = line.split(",", 3)
+        kind = parts[0]
+        if kind == "U" and len(parts) == 4:
+            self._on_update(int(parts[1]), int(parts[2]), parts[3])
+        elif kind == "CONOK":
+            # CONOK,<session-id>,<request-limit>,<keepalive-ms>,<control-link>
+            fields = line.split(",")
+            self.session_id = fields[1]
+            base = self.endpoint
+            if len(fields) > 4 and fields[4] not in ("", "*"):
+                scheme = self.endpoint.split("://", 1)[0]
+                base = f"{scheme}://{fields[4]}"
+            self.control_url = f"{base}/lightstreamer/control.txt"
+            self.connected.set()
+            logging.info(f"Price stream connected (session {self.session_id})")
+            with self._lock:
+                subs = list(self._subs.values())
+            for sub in subs:
+                sub.values.clear()
+                self._send_subscribe(sub)
+            return True
+        elif kind in ("CONERR", "ERROR", "REQERR"):
+            logging.warning(f"Stream error message: {line}")
+        elif kind == "END":
+            logging.info(f"Stream ended by server: {line}")
+        return False
+
+    def _on_update(self, sub_id: int, item_idx: int, raw: str) -> None:
+        sub = self._subs.get(sub_id)
+        if sub is None or item_idx < 1 or item_idx > len(sub.items):
+            return
+        values = decode_update(raw, sub.values.get(item_idx, []))
+        sub.values[item_idx] = values
+        try:
+            sub.listener(sub.items[item_idx - 1], dict(zip(sub.fields, values)))
+        except Exception as e:
+            logging.error(f"Stream listener error: {e}")
+
+    def _send_subscribe(self, sub: Subscription) -> None:
+        ok = self._control({
+            "LS_op": "add",
+            "LS_subId": str(sub.sub_id),
+            "LS_mode": sub.mode,
+            "LS_group": " ".join(sub.items),
+            "LS_schema": " ".join(sub.fields),
+            "LS_snapshot": "true",
+        })
+        if not ok and self.connected.is_set() and self.on_subscription_error:
+            try:
+                self.on_subscription_error(sub)
+            except Exception as e:
+                logging.error(f"on_subscription_error error: {e}")
+
+    def _control(self, body: Dict[str, str]) -> bool:
+        if not self.session_id or not self.control_url:
+            return False
+        with self._lock:
+            req_id = self._next_req
+            self._next_req += 1
+        data = {"LS_reqId": str(req_id), "LS_session": self.session_id, **body}
+        try:
+            r = self.http.post(self.control_url, params={"LS_protocol": TLCP_VERSION}, data=data, timeout=10)
+            if r.status_code == 200 and not r.text.startswith("REQERR"):
+                return True
+            logging.warning(f"Stream control {body.get('LS_op')} failed: {r.status_code} {r.text}")
+        except RequestException as e:
+            logging.error(f"Stream control error: {e}")
+        return False
+
+class PriceStream:
+    """
+    Subscribes IG MARKET:{epic} items and writes every update into a TickCache.
+    """
+    FIELDS = ["BID", "OFFER", "HIGH", "LOW", "UPDATE_TIME", "MARKET_STATE"]
+
+    def __init__(self, client: LightstreamerClient, tick_cache: Optional[TickCache] = None):
+        self.client = client
+        self.ticks = tick_cache or TickCache()
+        self._sub_ids: Dict[str, int] = {}
+        # A dropped stream must not leave old prices looking live.
+        self._disconnect_listeners: List[Callable[[], None]] = [self.ticks.mark_stale]
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_subscription_error = self._on_subscription_error
+
+    def add_disconnect_listener(self, fn: Callable[[], None]) -> None:
+        """fn() is called (on the stream thread) whenever the connection drops."""
+        self._disconnect_listeners.append(fn)
+
+    def _on_disconnect(self) -> None:
+        for fn in self._disconnect_listeners:
+            try:
+                fn()
+            except Exception as e:
+                logging.error(f"Disconnect listener error: {e}")
+
+    def start(self) -> None:
+        self.client.start()
+
+    def stop(self) -> None:
+        self.client.stop()
+
+    def subscribe(self, epics: List[str]) -> None:
+        new = [e for e in dict.fromkeys(epics) if e not in self._sub_ids]
+        if not new:
+            return
+        sub_id = self.client.subscribe([f"MARKET:{e}" for e in new], self.FIELDS, self._on_market)
+        for e in new:
+            self._sub_ids[e] = sub_id
+
+    def _on_subscription_error(self, sub: Subscription) -> None:
+        # Prices for these epics will not move any more; let readers fall back to REST.
+        for item in sub.items:
+            self.ticks.mark_stale(item.split(":", 1)[1])
+
+    def _on_market(self, item: str, values: Dict[str, Optional[str]]) -> None:
+        epic = item.split(":", 1)[1]
+        self.ticks.update(epic, _to_float(values.get("BID")), _to_float(values.get("OFFER")), values)
+
+class TradeStream:
+    """
+    Subscribes the account's TRADE:{accountId} item and passes every OPU
+    (open position update) payload, decoded from its JSON string, to each
+    add_listener() callback, e.g. PositionBook.on_trade_update.
+    """
+    FIELDS = ["OPU"]
+
+    def __init__(self, client: LightstreamerClient, account_id: str):
+        self.client = client
+        self.account_id = account_id
+        self._listeners: List[Callable[[Dict], None]] = []
+        self._sub_id: Optional[int] = None
+
+    def add_listener(self, fn: Callable[[Dict], None]) -> None:
+        self._listeners.append(fn)
+
+    def subscribe(self) -> None:
+        if self._sub_id is None:
+            self._sub_id = self.client.subscribe([f"TRADE:{self.account_id}"], self.FIELDS,
+                                                 self._on_trade, mode="DISTINCT")
+
+    def _on_trade(self, item: str, values: Dict[str, Optional[str]]) -> None:
+        raw = values.get("OPU")
+        if not raw:
+            return
+        try:
+            opu = json.loads(raw)
+        except ValueError:
+            logging.warning(f"Undecodable OPU on {item}: {raw[:200]}")
+            return
+        for fn in self._listeners:
+            try:
+                fn(opu)
+            except Exception as e:
+                logging.error(f"Trade listener error: {e}")
+
+def _to_float(v: Optional[str]) -> Optional[float]:
+    if v is None or v == "":
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        return None
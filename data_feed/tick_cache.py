@@ -0,0 +1,92 @@
+# This file holds the latest streamed tick per epic.
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+class Tick:
+    __slots__ = ("epic", "bid", "offer", "ts", "fields")
+
+    def __init__(self, epic: str, bid: Optional[float], offer: Optional[float],
+                 ts: float, fields: Optional[Dict] = None):
+        self.epic = epic
+        self.bid = bid
+        self.offer = offer
+        self.ts = ts
+        self.fields = fields or {}
+
+    @property
+    def mid(self) -> Optional[float]:
+        if self.bid is None or self.offer is None:
+            return None
+        return (self.bid + self.offer) / 2.0
+
+class TickCache:
+    """
+    Thread-safe latest-tick store fed by the streaming client.
+
+    Writers replace the whole Tick object, so readers never see a half
+    updated bid/offer pair. Listeners are called on the writer's thread
+    after every update and must be quick.
+
+    A tick stays current until the stream says otherwise: PriceStream calls
+    mark_stale() when the connection drops or a subscription fails, so a
+    quiet but live market keeps being served from here. max_age > 0 adds
+    an age limit for feeds without that signal.
+    """
+    def __init__(self, max_age: float = 0.0):
+        self.max_age = float(max_age)
+        self._ticks: Dict[str, Tick] = {}
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Tick], None]] = []
+
+    def add_listener(self, fn: Callable[[Tick], None]) -> None:
+        with self._lock:
+            self._listeners.append(fn)
+
+    def remove_listener(self, fn: Callable[[Tick], None]) -> None:
+        with self._lock:
+            if fn in self._listeners:
+                self._listeners.remove(fn)
+
+    def update(self, epic: str, bid: Optional[float], offer: Optional[float],
+               fields: Optional[Dict] = None, ts: Optional[float] = None) -> Tick:
+        with self._lock:
+            prev = self._ticks.get(epic)
+            if prev is not None:
+                # Streams only send changed fields; keep the last known side.
+                bid = prev.bid if bid is None else bid
+                offer = prev.offer if offer is None else offer
+                if fields is not None:
+                    fields = {**prev.fields, **fields}
+            tick = Tick(epic, bid, offer, time.time() if ts is None else ts, fields)
+            self._ticks[epic] = tick
+            listeners = list(self._listeners)
+        for fn in listeners:
+            try:
+                fn(tick)
+            except Exception as e:
+                logging.error(f"Tick listener error for {epic}: {e}")
+        return tick
+
+    def get(self, epic: str, max_age: Optional[float] = None) -> Optional[Tick]:
+        """Returns the latest tick for epic, or None if absent or older than max_age."""
+        tick = self._ticks.get(epic)
+        if tick is None:
+            return None
+        age = self.max_age if max_age is None else max_age
+        if age and time.time() - tick.ts > age:
+            return None
+        return tick
+
+    def mark_stale(self, epic: Optional[str] = None) -> None:
+        """Drops ticks (e.g. after a stream disconnect) so readers fall back to REST."""
+        with self._lock:
+            if epic is None:
+                self._ticks.clear()
+            else:
+                self._ticks.pop(epic, None)
+
+    def epics(self) -> List[str]:
+        with self._lock:
+            return list(self._ticks)
@@ -0,0 +1,32 @@
+# Headless kill switch: closes every open position and cancels every working order.
+import os
+import sys
+import logging
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from ig_trading.trading_bot import TradingBot
+
+def main() -> int:
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    mode = sys.argv[1] if len(sys.argv) > 1 else "demo"
+    bot = TradingBot(mode=mode)
+    if not bot.authenticate():
+        logging.critical("Login failed; nothing was flattened.")
+        return 2
+    try:
+        report = bot.flatten_all()
+    finally:
+        bot.logout()
+    for r in report["positions"] + report["orders"]:
+        if not r["ok"]:
+            print(f"FAILED {r['epic']} {r['dealId']}: {r['error']}")
+    for e in report["errors"]:
+        print(f"FAILED {e}")
+    print(f"{'FLAT' if report['flat'] else 'NOT FLAT'} in {report['time_to_flat']:.2f}s "
+          f"({len(report['positions'])} positions, {len(report['orders'])} orders; "
+          f"remaining {report['remaining']['positions']} positions, {report['remaining']['orders']} orders)")
+    return 0 if report["flat"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,6 +20,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from ig_trading.trading_bot import TradingBot
 from ig_trading.ladder_engine import LadderParams, place_breakout_ladder
+from ig_trading.indicators import IndicatorEngine, DEFAULT_CONFIG, fetch_closes, rank_closes
 
 # Placeholder for styles
 def apply_styles(root):
@@ -30,6 +31,9 @@ def apply_styles(root):
         logging.warning("styles.py not found. Using default Tkinter styles.")
 
 CONFIG_PATH = Path(__file__).resolve().parent / "ig_trading" / "bot_config_from_history.json"
+if not CONFIG_PATH.exists():
+    # The config ships at the repo root.
+    CONFIG_PATH = Path(__file__).resolve().parent / "bot_config_from_history.json"
 try:
     with CONFIG_PATH.open() as f:
         BOTCFG = json.load(f)
@@ -43,8 +47,17 @@ class RsiRotationConfig:
         self.ema_slow = ema_slow
         self.rsi_len = rsi_len
 
+RSI_CFG = RsiRotationConfig(**{k: BOTCFG.get("global", {}).get(k, v) for k, v in DEFAULT_CONFIG.items()})
+
 def rank_instruments_by_rsi(watchlist, fetch_candles, RSI_CFG):
-    return []
+    """
+    Ranks a watchlist by EMA crossover then RSI. fetch_candles(epic) must
+    return a get_candles-style DataFrame; fetches run concurrently and the
+    scoring is vectorised across all epics. Returns a list of dicts, best first.
+    """
+    closes = fetch_closes(watchlist, fetch_candles)
+    table = rank_closes(closes, RSI_CFG.ema_fast, RSI_CFG.ema_slow, RSI_CFG.rsi_len)
+    return [{"epic": epic, **row} for epic, row in table.to_dict("index").items()]
 
 def rotation_and_manage_positions(signals, open_positions, close_fn, ladder_fn, RSI_CFG):
     pass
@@ -63,7 +76,8 @@ class IGControlGUI:
     def __init__(self, master):
         self.master = master
         self.master.title("IG Trading Bot Control")
-        self.bot = TradingBot()
+        # The bot's IndicatorEngine keeps per-epic EMA/RSI, updated bar by bar once seeded.
+        self.bot = TradingBot(indicators=IndicatorEngine.from_config(CONFIG_PATH))
         self.logged_in = False
         self.is_trading = False
         self.trade_thread = None
@@ -106,6 +120,8 @@ class IGControlGUI:
         self.other_controls_frame.pack(fill="x", pady=5)
         self.cancel_all_btn = ttk.Button(self.other_controls_frame, text="Cancel All Orders", command=self._cancel_all, state="disabled")
         self.cancel_all_btn.pack(side="left", fill="x", expand=True, padx=(0, 5))
+        self.flatten_btn = ttk.Button(self.other_controls_frame, text="Flatten All", command=self._flatten_all, state="disabled")
+        self.flatten_btn.pack(side="left", fill="x", expand=True, padx=(0, 5))
         self.epic_label = ttk.Label(self.other_controls_frame, text="Epic:")
         self.epic_label.pack(side="left", padx=(0, 5))
         self.epic_entry = ttk.Entry(self.other_controls_frame)
@@ -120,6 +136,7 @@ class IGControlGUI:
             self.start_btn.config(state="normal")
             self.stop_btn.config(state="disabled")
             self.cancel_all_btn.config(state="normal")
+            self.flatten_btn.config(state="normal")
         else:
             self._log("Login failed.")
 
@@ -132,6 +149,7 @@ class IGControlGUI:
         self.start_btn.config(state="disabled")
         self.stop_btn.config(state="disabled")
         self.cancel_all_btn.config(state="disabled")
+        self.flatten_btn.config(state="disabled")
         
     def _start_trading(self):
         if not self.is_trading:
@@ -155,20 +173,54 @@ class IGControlGUI:
         
     def _run_trading_logic(self):
         # Placeholder for the main trading loop
+        watchlist = BOTCFG.get("watchlist", [])
+        if DEFAULTS["trail_stop"] and self.bot.trailing is None:
+            if self.bot.start_trailing(DEFAULTS["trail_stop_dist"]):
+                self._log(f"Trailing stops {DEFAULTS['trail_stop_dist']} pts behind price.")
+            else:
+                self._log("Trailing stops need the price stream; not trailing.")
         while self.is_trading:
-            self._log("Trading logic loop running...")
+            self.bot.sync_trailing()
+            if watchlist:
+                report = self.bot.scan_watchlist(watchlist)
+                breakouts = [e for e, hit in report.values.items() if hit]
+                self._log(f"Scan: {report.summary()}; breakouts: {', '.join(breakouts) or 'none'}")
+                ranked = self.bot.rank_watchlist(watchlist)
+                top = [f"{e} (RSI {row.rsi:.0f})" for e, row in ranked.head(3).iterrows()]
+                self._log(f"Top ranked: {', '.join(top) or 'none (warming up)'}")
+            else:
+                self._log("Trading logic loop running...")
             time.sleep(5)
         self._log("Trading logic stopped.")
 
     def _cancel_all(self):
-        epic = self.epic_entry.get()
+        epic = self.epic_entry.get().strip()
         if epic:
             self._log(f"Cancelling all orders for epic: {epic}")
             cancelled_count = self.bot.om.cancel_all_for_epic(epic)
             self._log(f"Cancelled {cancelled_count} working orders for {epic}.")
-        else:
-            messagebox.showerror("Error", "Please enter an Epic ID to cancel orders.")
+        elif messagebox.askyesno("Cancel All", "No epic entered. Cancel ALL working orders on every epic?"):
+            self._log("Cancelling all working orders...")
+            results = self.bot.om.cancel_all()
+            failed = [r["dealId"] for r in results if not r["ok"]]
+            self._log(f"Cancelled {len(results) - len(failed)}/{len(results)} working orders."
+                      + (f" Failed: {', '.join(failed)}" if failed else ""))
             
+    def _flatten_all(self):
+        if not messagebox.askyesno("Flatten All", "Close ALL open positions and cancel ALL working orders?"):
+            return
+        self._stop_trading()
+        self._log("FLATTEN ALL: closing every position and cancelling every order...")
+        threading.Thread(target=self._run_flatten, daemon=True).start()
+
+    def _run_flatten(self):
+        report = self.bot.flatten_all()
+        for r in report["positions"] + report["orders"]:
+            if not r["ok"]:
+                self._log(f"  {r['epic']} {r['dealId']}: {r['error']}")
+        self._log(f"Flatten {'complete' if report['flat'] else 'INCOMPLETE'} in {report['time_to_flat']:.2f}s: "
+                  f"{len(report['positions'])} positions, {len(report['orders'])} orders.")
+
     def _log(self, msg):
         self.log_text.config(state="normal")
         self.log_text.insert(tk.END, f"{msg}\n")
@@ -0,0 +1,165 @@
+# This file resolves deal references against /confirms in the background.
+import heapq
+import threading
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from requests import RequestException
+
+class DealConfirmation:
+    __slots__ = ("deal_reference", "status", "reason", "deal_id", "epic", "level", "data")
+
+    def __init__(self, deal_reference: str, status: str, reason: Optional[str] = None,
+                 deal_id: Optional[str] = None, epic: Optional[str] = None,
+                 level: Optional[float] = None, data: Optional[Dict] = None):
+        self.deal_reference = deal_reference
+        self.status = status          # ACCEPTED, REJECTED or UNKNOWN (gave up waiting)
+        self.reason = reason
+        self.deal_id = deal_id
+        self.epic = epic
+        self.level = level
+        self.data = data or {}
+
+    @property
+    def accepted(self) -> bool:
+        return self.status == "ACCEPTED"
+
+    def __repr__(self):
+        return f"DealConfirmation({self.deal_reference!r}, {self.status}, {self.reason}, {self.deal_id})"
+
+class _Pending:
+    __slots__ = ("future", "callbacks", "attempt", "deadline")
+
+    def __init__(self, deadline: float):
+        self.future: Future = Future()
+        self.callbacks: List[Callable[[DealConfirmation], None]] = []
+        self.attempt = 0
+        self.deadline = deadline
+
+class DealConfirmTracker:
+    """
+    Polls GET /confirms/{dealReference} for queued references without
+    blocking the caller.
+
+    track() returns a Future that resolves to a DealConfirmation; callbacks
+    registered for the same reference run when it resolves. A 404 means the
+    confirm is not ready yet, so the reference is polled again after
+    poll_interval * 2**attempt (capped at max_backoff) until max_wait has
+    passed, at which point it resolves as UNKNOWN. A dispatcher thread keeps
+    the due times in a heap and hands each GET to a pool of `workers`
+    threads, so many references can be in flight at once.
+    """
+    def __init__(self, session, headers, base_url, workers: int = 4, poll_interval: float = 0.2,
+                 max_backoff: float = 2.0, max_wait: float = 15.0):
+        self.session = session
+        self.headers = headers
+        self.base_url = base_url
+        self.poll_interval = float(poll_interval)
+        self.max_backoff = float(max_backoff)
+        self.max_wait = float(max_wait)
+        self.listeners: List[Callable[[DealConfirmation], None]] = []
+        self.counts = {"ACCEPTED": 0, "REJECTED": 0, "UNKNOWN": 0, "polls": 0}
+        self._pending: Dict[str, _Pending] = {}
+        self._due: List[Tuple[float, str]] = []
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=int(workers), thread_name_prefix="confirm")
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    def add_listener(self, fn: Callable[[DealConfirmation], None]) -> None:
+        """fn(confirmation) is called for every resolved reference."""
+        self.listeners.append(fn)
+
+    def track(self, deal_reference: str,
+              callback: Optional[Callable[[DealConfirmation], None]] = None) -> Future:
+        with self._cond:
+            p = self._pending.get(deal_reference)
+            if p is None:
+                p = self._pending[deal_reference] = _Pending(time.monotonic() + self.max_wait)
+                heapq.heappush(self._due, (time.monotonic(), deal_reference))
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._dispatch, name="confirm-dispatch", daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+            if callback is not None:
+                p.callbacks.append(callback)
+            return p.future
+
+    def wait(self, deal_reference: str, timeout: Optional[float] = None) -> DealConfirmation:
+        """Blocking convenience wrapper around track()."""
+        return self.track(deal_reference).result(timeout)
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop and (not self._due or self._due[0][0] > time.monotonic()):
+                    timeout = None if not self._due else self._due[0][0] - time.monotonic()
+                    self._cond.wait(timeout)
+                if self._stop:
+                    return
+                _, ref = heapq.heappop(self._due)
+            try:
+                self._pool.submit(self._poll, ref)
+            except RuntimeError:
+                return  # pool shut down
+
+    def _poll(self, ref: str) -> None:
+        with self._cond:
+            self.counts["polls"] += 1
+        h = self.headers.copy()
+        h["Version"] = "1"
+        try:
+            r = self.session.get(f"{self.base_url}/confirms/{ref}", headers=h)
+            status = r.status_code
+            data = r.json() if status == 200 else None
+        except (RequestException, ValueError) as e:
+            logging.debug(f"Confirm poll for {ref} failed: {e}")
+            status, data = None, None
+
+        if data and data.get("dealStatus"):
+            self._resolve(ref, DealConfirmation(
+                ref, data.get("dealStatus"), data.get("reason"), data.get("dealId"),
+                data.get("epic"), data.get("level"), data))
+            return
+
+        # 404 (not ready), throttled or network error: back off and try again.
+        with self._cond:
+            p = self._pending.get(ref)
+            if p is None:
+                return
+            p.attempt += 1
+            due = time.monotonic() + min(self.max_backoff, self.poll_interval * (2 ** (p.attempt - 1)))
+            if due <= p.deadline:
+                heapq.heappush(self._due, (due, ref))
+                self._cond.notify()
+                return
+        self._resolve(ref, DealConfirmation(ref, "UNKNOWN", f"no confirm after {self.max_wait:.0f}s (last status {status})"))
+
+    def _resolve(self, ref: str, conf: DealConfirmation) -> None:
+        with self._cond:
+            p = self._pending.pop(ref, None)
+            if p is None:
+                return
+            self.counts[conf.status if conf.status in ("ACCEPTED", "REJECTED") else "UNKNOWN"] += 1
+        if conf.accepted:
+            logging.info(f"Deal {ref} accepted: dealId {conf.deal_id}")
+        else:
+            logging.warning(f"Deal {ref} {conf.status}: {conf.reason}")
+        for fn in self.listeners + p.callbacks:
+            try:
+                fn(conf)
+            except Exception as e:
+                logging.error(f"Confirm callback for {ref} failed: {e}")
+        p.future.set_result(conf)
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,223 @@
+# This file checks orders against IG's dealing rules locally, before they are sent.
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Market states (REST marketStatus and streaming MARKET_STATE) that refuse new orders.
+BLOCKED_STATES = {"CLOSED", "OFFLINE", "SUSPENDED", "EDITS_ONLY", "EDIT",
+                  "ON_AUCTION_NO_EDITS", "AUCTION_NO_EDIT"}
+
+def _rule(rules: Dict, name: str) -> Tuple[Optional[float], str]:
+    r = rules.get(name) or {}
+    v = r.get("value")
+    return (float(v) if v is not None else None), r.get("unit") or "POINTS"
+
+class DealingRules:
+    """Parsed dealingRules/instrument block for one epic."""
+    __slots__ = ("min_size", "min_stop", "min_gslo_stop", "max_stop",
+                 "min_step", "gslo_allowed", "trailing_allowed", "decimals")
+
+    def __init__(self, rules: Dict, snapshot: Optional[Dict] = None):
+        dr = rules.get("dealingRules") or {}
+        inst = rules.get("instrument") or {}
+        self.min_size = _rule(dr, "minDealSize")
+        self.min_stop = _rule(dr, "minNormalStopOrLimitDistance")
+        self.min_gslo_stop = _rule(dr, "minControlledRiskStopDistance")
+        self.max_stop = _rule(dr, "maxStopOrLimitDistance")
+        self.min_step = _rule(dr, "minStepDistance")
+        self.gslo_allowed = bool(inst.get("controlledRiskAllowed", True))
+        self.trailing_allowed = dr.get("trailingStopsPreference", "AVAILABLE") != "NOT_AVAILABLE"
+        self.decimals = _decimals_from_snapshot(snapshot)
+
+    @staticmethod
+    def points(rule: Tuple[Optional[float], str], price: float) -> Optional[float]:
+        """A rule value in points; PERCENTAGE rules are taken of `price`."""
+        v, unit = rule
+        if v is None:
+            return None
+        return v * price / 100.0 if unit == "PERCENTAGE" else v
+
+def _decimals_from_snapshot(snapshot: Optional[Dict]) -> int:
+    f = (snapshot or {}).get("decimalPlacesFactor")
+    return int(f) if f is not None else 2
+
+class RungCheck:
+    __slots__ = ("ok", "level", "size", "stop_distance", "guaranteed", "reason", "adjusted")
+
+    def __init__(self, ok: bool, level: float, size: float, stop_distance: Optional[float],
+                 guaranteed: bool, reason: Optional[str] = None, adjusted: Tuple[str, ...] = ()):
+        self.ok = ok
+        self.level = level
+        self.size = size
+        self.stop_distance = stop_distance
+        self.guaranteed = guaranteed
+        self.reason = reason
+        self.adjusted = adjusted
+
+    def __repr__(self):
+        state = "ok" if self.ok else self.reason
+        return f"RungCheck({state}, level={self.level}, size={self.size}, stop={self.stop_distance})"
+
+def check_rung(rules: DealingRules, direction: str, level: float, size: float,
+               bid: Optional[float], offer: Optional[float], stop_distance: Optional[float] = None,
+               guaranteed: bool = False, trailing: bool = False,
+               market_state: Optional[str] = None, snap_level: bool = True) -> RungCheck:
+    """
+    Validates one STOP_ENTRY rung and snaps it to legal values: the level is
+    rounded to the market's precision and pushed at least the minimum order
+    distance beyond the current price (with snap_level=False a level that
+    close is refused instead, so ladder rungs are never stacked), a size below the minimum (or None) is
+    raised to the minimum, and the stop distance is clamped to the
+    normal (or guaranteed) minimum and the maximum. Rungs that cannot be made
+    legal (market not dealable, GSLO or trailing stops not offered) fail
+    with a reason instead.
+    """
+    adjusted = []
+    if market_state in BLOCKED_STATES:
+        return RungCheck(False, level, size, stop_distance, guaranteed, f"market {market_state}")
+    if guaranteed and not rules.gslo_allowed:
+        return RungCheck(False, level, size, stop_distance, guaranteed, "guaranteed stops not allowed")
+    if trailing and not rules.trailing_allowed:
+        return RungCheck(False, level, size, stop_distance, guaranteed, "trailing stops not available")
+
+    ref = offer if direction == "BUY" else bid
+    scale = 10.0 ** rules.decimals
+    lvl = round(float(level), rules.decimals)
+    if ref is not None:
+        gap = DealingRules.points(rules.min_stop, ref) or 0.0
+        too_close = lvl < ref + gap if direction == "BUY" else lvl > ref - gap
+        if too_close and not snap_level:
+            return RungCheck(False, lvl, size, stop_distance, guaranteed,
+                             f"level {lvl} inside minimum distance {gap} of {ref}")
+        if too_close and direction == "BUY":
+            lvl = math.ceil((ref + gap) * scale - 1e-9) / scale
+            adjusted.append("level")
+        elif too_close:
+            lvl = math.floor((ref - gap) * scale + 1e-9) / scale
+            adjusted.append("level")
+
+    min_size = rules.min_size[0]
+    sz = float(size) if size is not None else (min_size or 1.0)
+    # IG publishes no size increment, so larger sizes are sent as asked rather than rounded up.
+    if min_size is not None and sz < min_size:
+        sz = min_size
+        adjusted.append("size")
+
+    stop = stop_distance
+    if stop is not None:
+        stop = float(stop)
+        lo = DealingRules.points(rules.min_gslo_stop if guaranteed else rules.min_stop, lvl)
+        hi = DealingRules.points(rules.max_stop, lvl)
+        if lo is not None and stop < lo:
+            stop = lo
+            adjusted.append("stop")
+        if hi is not None and stop > hi:
+            stop = hi
+            adjusted.append("stop")
+        if trailing:
+            step_pts = DealingRules.points(rules.min_step, lvl)
+            if step_pts and stop < step_pts:
+                stop = step_pts
+                adjusted.append("stop")
+    return RungCheck(True, lvl, sz, stop, guaranteed, None, tuple(dict.fromkeys(adjusted)))
+
+def check_ladder(rules: DealingRules, direction: str, levels: List[float], sizes: List[float],
+                 bid: Optional[float], offer: Optional[float], stop_distance: Optional[float] = None,
+                 guaranteed: bool = False, trailing: bool = False,
+                 market_state: Optional[str] = None) -> List[RungCheck]:
+    """
+    check_rung for a whole ladder. If the nearest rung is inside the minimum
+    distance, every rung is shifted away from the price by the same amount,
+    so the ladder keeps its spacing instead of several rungs collapsing onto
+    one level. Rungs that still land on the level of an earlier rung (after
+    rounding to the market's precision) are refused.
+    """
+    ref = offer if direction == "BUY" else bid
+    scale = 10.0 ** rules.decimals
+    lvls = [round(float(l), rules.decimals) for l in levels]
+    if ref is not None and lvls:
+        gap = DealingRules.points(rules.min_stop, ref) or 0.0
+        if direction == "BUY":
+            shift = max(0.0, math.ceil((ref + gap - min(lvls)) * scale - 1e-9) / scale)
+        else:
+            shift = min(0.0, math.floor((ref - gap - max(lvls)) * scale + 1e-9) / scale)
+        lvls = [round(l + shift, rules.decimals) for l in lvls]
+    checks, seen = [], set()
+    for orig, lvl, size in zip(levels, lvls, sizes):
+        chk = check_rung(rules, direction, lvl, size, bid, offer, stop_distance,
+                         guaranteed, trailing, market_state, snap_level=False)
+        if chk.ok and chk.level in seen:
+            chk = RungCheck(False, chk.level, chk.size, chk.stop_distance, guaranteed,
+                            f"collides with another rung at {chk.level}")
+        elif chk.ok:
+            seen.add(chk.level)
+            if chk.level != float(orig):
+                chk.adjusted = tuple(dict.fromkeys(("level",) + chk.adjusted))
+        checks.append(chk)
+    return checks
+
+class PreTradeValidator:
+    """
+    Runs check_rung against cached dealing rules. Rules come from the
+    MarketData snapshot cache (refetched only when its rules TTL lapses) and
+    are parsed once per cached payload; prices and market state come from
+    the tick cache when streaming, else the cached snapshot.
+    """
+    def __init__(self, market_data):
+        self.md = market_data
+        self._parsed: Dict[str, Tuple[Dict, DealingRules]] = {}
+        self._lock = threading.Lock()
+
+    def rules(self, epic: str) -> Optional[DealingRules]:
+        raw = self.md.cache.get_rules(epic)
+        if raw is None:
+            if self.md.fetch_market(epic) is None:
+                return None
+            raw = self.md.cache.get_rules(epic)
+            if raw is None:
+                return None
+        with self._lock:
+            hit = self._parsed.get(epic)
+            if hit is not None and hit[0] is raw:
+                return hit[1]
+            parsed = DealingRules(raw, self.md.cache.get_snapshot(epic))
+            self._parsed[epic] = (raw, parsed)
+            return parsed
+
+    def _context(self, epic: str):
+        """(rules, bid, offer, market state) from the caches."""
+        _, _, bid, offer = self.md.get_market_details(epic)
+        rules = self.rules(epic)
+        tick = self.md._live_tick(epic)
+        if tick is not None:
+            state = tick.fields.get("MARKET_STATE")
+        else:
+            state = (self.md.cache.get_snapshot(epic) or {}).get("marketStatus")
+        return rules, bid, offer, state
+
+    def min_stop_distance(self, epic: str) -> Optional[float]:
+        """Smallest normal stop distance (in points, at the current price) IG accepts for epic."""
+        rules, bid, offer, _ = self._context(epic)
+        if rules is None:
+            return None
+        price = offer if offer is not None else bid
+        return DealingRules.points(rules.min_stop, price) if price is not None else rules.min_stop[0]
+
+    def check(self, epic: str, direction: str, level: float, size: float,
+              stop_distance: Optional[float] = None, guaranteed: bool = False,
+              trailing: bool = False, snap_level: bool = True) -> RungCheck:
+        rules, bid, offer, state = self._context(epic)
+        if rules is None:
+            return RungCheck(False, level, size, stop_distance, guaranteed, "no dealing rules")
+        return check_rung(rules, direction, level, size, bid, offer, stop_distance,
+                          guaranteed, trailing, state, snap_level)
+
+    def check_ladder(self, epic: str, direction: str, levels: List[float], sizes: List[float],
+                     stop_distance: Optional[float] = None, guaranteed: bool = False,
+                     trailing: bool = False) -> List[RungCheck]:
+        rules, bid, offer, state = self._context(epic)
+        if rules is None:
+            return [RungCheck(False, l, s, stop_distance, guaranteed, "no dealing rules")
+                    for l, s in zip(levels, sizes)]
+        return check_ladder(rules, direction, levels, sizes, bid, offer, stop_distance,
+                            guaranteed, trailing, state)
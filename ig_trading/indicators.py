@@ -0,0 +1,268 @@
+# This file keeps incremental EMA and RSI state per epic.
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+
+from data_feed.candle_store import bar_time
+
+DEFAULT_CONFIG = {"ema_fast": 12, "ema_slow": 26, "rsi_len": 14}
+
+def load_indicator_config(path) -> Dict[str, int]:
+    """Reads the "global" block of bot_config_from_history.json, falling back to defaults."""
+    cfg = dict(DEFAULT_CONFIG)
+    try:
+        with Path(path).open() as f:
+            cfg.update((json.load(f) or {}).get("global", {}))
+    except FileNotFoundError:
+        logging.warning(f"{path} not found; using default indicator settings.")
+    return {k: int(cfg[k]) for k in DEFAULT_CONFIG}
+
+class EMA:
+    """Exponential moving average seeded with the SMA of its first `period` values."""
+    def __init__(self, period: int):
+        self.period = int(period)
+        self.alpha = 2.0 / (self.period + 1)
+        self.value: Optional[float] = None
+        self._seed_sum = 0.0
+        self._seed_n = 0
+
+    def update(self, x: float) -> Optional[float]:
+        if self.value is None:
+            self._seed_sum += x
+            self._seed_n += 1
+            if self._seed_n == self.period:
+                self.value = self._seed_sum / self.period
+            return self.value
+        self.value += self.alpha * (x - self.value)
+        return self.value
+
+class WilderRSI:
+    """RSI with Wilder smoothing; the first value needs period + 1 closes."""
+    def __init__(self, period: int):
+        self.period = int(period)
+        self.avg_gain: Optional[float] = None
+        self.avg_loss: Optional[float] = None
+        self.value: Optional[float] = None
+        self._prev: Optional[float] = None
+        self._gains = 0.0
+        self._losses = 0.0
+        self._n = 0
+
+    def update(self, close: float) -> Optional[float]:
+        prev, self._prev = self._prev, close
+        if prev is None:
+            return None
+        change = close - prev
+        gain = change if change > 0 else 0.0
+        loss = -change if change < 0 else 0.0
+        if self.avg_gain is None:
+            self._gains += gain
+            self._losses += loss
+            self._n += 1
+            if self._n < self.period:
+                return None
+            self.avg_gain = self._gains / self.period
+            self.avg_loss = self._losses / self.period
+        else:
+            n = self.period
+            self.avg_gain = (self.avg_gain * (n - 1) + gain) / n
+            self.avg_loss = (self.avg_loss * (n - 1) + loss) / n
+        if self.avg_loss == 0:
+            self.value = 100.0 if self.avg_gain > 0 else 50.0
+        else:
+            self.value = 100.0 - 100.0 / (1.0 + self.avg_gain / self.avg_loss)
+        return self.value
+
+class _EpicState:
+    __slots__ = ("fast", "slow", "rsi", "last_time", "close")
+
+    def __init__(self, ema_fast: int, ema_slow: int, rsi_len: int):
+        self.fast = EMA(ema_fast)
+        self.slow = EMA(ema_slow)
+        self.rsi = WilderRSI(rsi_len)
+        self.last_time = None
+        self.close: Optional[float] = None
+
+    def update(self, close: float, t=None) -> None:
+        self.fast.update(close)
+        self.slow.update(close)
+        self.rsi.update(close)
+        self.close = close
+        if t is not None:
+            self.last_time = t
+
+class IndicatorEngine:
+    """
+    Per-epic EMA fast/slow and Wilder RSI over closed bars of one resolution.
+
+    Each epic is seeded once from history (seed / update_from_frame); after
+    that every closed bar costs O(1), whatever the lookback. on_bar() can be
+    registered as a BarAggregator listener.
+    """
+    def __init__(self, ema_fast: int = 12, ema_slow: int = 26, rsi_len: int = 14, resolution: str = "MINUTE"):
+        self.ema_fast = int(ema_fast)
+        self.ema_slow = int(ema_slow)
+        self.rsi_len = int(rsi_len)
+        self.resolution = resolution
+        self._states: Dict[str, _EpicState] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path, resolution: str = "MINUTE") -> "IndicatorEngine":
+        return cls(resolution=resolution, **load_indicator_config(path))
+
+    @classmethod
+    def from_rsi_config(cls, cfg, resolution: str = "MINUTE") -> "IndicatorEngine":
+        """Builds an engine from a gui.RsiRotationConfig-like object."""
+        return cls(cfg.ema_fast, cfg.ema_slow, cfg.rsi_len, resolution=resolution)
+
+    @property
+    def warmup_bars(self) -> int:
+        """Closed bars needed before every indicator has a value."""
+        return max(self.ema_fast, self.ema_slow, self.rsi_len + 1)
+
+    def is_seeded(self, epic: str) -> bool:
+        return epic in self._states
+
+    def seed(self, epic: str, closes: Iterable[float], last_time=None) -> None:
+        st = _EpicState(self.ema_fast, self.ema_slow, self.rsi_len)
+        for c in closes:
+            st.update(float(c))
+        st.last_time = last_time
+        with self._lock:
+            self._states[epic] = st
+
+    def update(self, epic: str, close: float, t=None) -> None:
+        with self._lock:
+            st = self._states.get(epic)
+            if st is None:
+                st = self._states[epic] = _EpicState(self.ema_fast, self.ema_slow, self.rsi_len)
+            if t is not None and st.last_time is not None and t <= st.last_time:
+                return
+            st.update(float(close), t)
+
+    def update_from_frame(self, epic: str, df: pd.DataFrame, forming_last: bool = True) -> None:
+        """
+        Seeds from a get_candles DataFrame on first sight, then applies only
+        rows newer than the last processed bar. With forming_last the final
+        row is treated as still open and skipped.
+        """
+        if df is None or df.empty:
+            return
+        closed = df.iloc[:-1] if forming_last else df
+        if closed.empty:
+            return
+        st = self._states.get(epic)
+        if st is None or st.last_time is None:
+            self.seed(epic, closed["close"].to_numpy(), closed.index[-1])
+            return
+        new = closed[closed.index > st.last_time]
+        for t, c in zip(new.index, new["close"].to_numpy()):
+            self.update(epic, c, t)
+
+    def on_bar(self, epic: str, resolution: str, candle: Dict) -> None:
+        if resolution != self.resolution or epic not in self._states:
+            return
+        close = (candle.get("closePrice") or {}).get("bid")
+        if close is None:
+            return
+        t = bar_time(candle)
+        self.update(epic, close, pd.Timestamp(t) if t is not None else None)
+
+    def values(self, epic: str) -> Optional[Dict[str, Optional[float]]]:
+        st = self._states.get(epic)
+        if st is None:
+            return None
+        return {
+            "close": st.close,
+            "ema_fast": st.fast.value,
+            "ema_slow": st.slow.value,
+            "rsi": st.rsi.value,
+        }
+
+    def snapshot(self) -> Dict[str, Dict[str, Optional[float]]]:
+        with self._lock:
+            epics = list(self._states)
+        return {e: self.values(e) for e in epics}
+
+    def rank(self, epics: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """The live indicator values in rank_closes' layout and order, without recomputing history."""
+        snap = self.snapshot()
+        if epics is not None:
+            snap = {e: snap[e] for e in dict.fromkeys(epics) if snap.get(e) is not None}
+        if not snap:
+            return _rank_table(pd.Series(dtype=float), pd.Series(dtype=float), pd.Series(dtype=float))
+        vals = pd.DataFrame(snap).T.astype(float)
+        return _rank_table(vals["ema_fast"], vals["ema_slow"], vals["rsi"])
+
+def fetch_closes(watchlist: Iterable[str], fetch_candles, max_workers: int = 16) -> pd.DataFrame:
+    """
+    Calls fetch_candles(epic) for every epic concurrently and aligns the
+    close columns into a time-by-epic frame. Gaps inside an epic's history
+    are forward-filled; nothing is filled past its last bar, so a stale epic
+    ends in NaN. Epics whose fetch fails or returns nothing are left out.
+    """
+    watchlist = list(dict.fromkeys(watchlist))
+    if not watchlist:
+        return pd.DataFrame()
+
+    def _one(epic):
+        try:
+            return epic, fetch_candles(epic)
+        except Exception as e:
+            logging.error(f"Candle fetch failed for {epic}: {e}")
+            return epic, None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(watchlist)))) as pool:
+        frames = list(pool.map(_one, watchlist))
+    series = {epic: df["close"] for epic, df in frames if df is not None and not df.empty}
+    if not series:
+        return pd.DataFrame()
+    raw = pd.DataFrame(series).sort_index()
+    return raw.ffill().where(raw.bfill().notna())
+
+def rank_closes(closes: pd.DataFrame, ema_fast: int, ema_slow: int, rsi_len: int) -> pd.DataFrame:
+    """
+    Vectorised EMA-crossover and Wilder-RSI scores for every column of a
+    time-by-epic close matrix, evaluated at the last row.
+
+    Returns a frame indexed by epic with ema_fast, ema_slow, spread_pct
+    (fast over slow, in percent), crossover (fast above slow) and rsi,
+    sorted with bullish crossovers first and then by RSI. Epics without
+    enough history for every indicator are dropped. The RSI here seeds its
+    smoothing from the first change rather than a simple mean, so it can
+    differ slightly from IndicatorEngine on short histories.
+    """
+    cols = ["ema_fast", "ema_slow", "spread_pct", "crossover", "rsi"]
+    if closes.empty:
+        return pd.DataFrame(columns=cols)
+    fast = closes.ewm(span=ema_fast, adjust=False, min_periods=ema_fast).mean().iloc[-1]
+    slow = closes.ewm(span=ema_slow, adjust=False, min_periods=ema_slow).mean().iloc[-1]
+
+    delta = closes.diff()
+    gain = delta.clip(lower=0.0)
+    loss = -delta.clip(upper=0.0)
+    avg_gain = gain.ewm(alpha=1.0 / rsi_len, adjust=False, min_periods=rsi_len).mean().iloc[-1]
+    avg_loss = loss.ewm(alpha=1.0 / rsi_len, adjust=False, min_periods=rsi_len).mean().iloc[-1]
+    rs = avg_gain / avg_loss
+    rsi = 100.0 - 100.0 / (1.0 + rs)
+    # Same edge cases as WilderRSI: no losses -> 100, no movement at all -> 50.
+    rsi = rsi.where(avg_loss != 0, 100.0).where((avg_gain != 0) | (avg_loss != 0), 50.0).where(avg_gain.notna())
+
+    return _rank_table(fast, slow, rsi)
+
+def _rank_table(fast: pd.Series, slow: pd.Series, rsi: pd.Series) -> pd.DataFrame:
+    table = pd.DataFrame({
+        "ema_fast": fast,
+        "ema_slow": slow,
+        "spread_pct": (fast - slow) / slow * 100.0,
+        "crossover": fast > slow,
+        "rsi": rsi,
+    }).dropna(subset=["ema_fast", "ema_slow", "rsi"])
+    table.index.name = "epic"
+    return table.sort_values(["crossover", "rsi"], ascending=[False, False])
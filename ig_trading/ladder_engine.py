@@ -1,18 +1,115 @@
 # This file contains the laddering logic.
-from typing import Dict, Optional, Callable
+from typing import Dict, List, Optional, Callable
 from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import logging
+import time
 
 class LadderParams:
     def __init__(self, first_offset_pts: float, step_pts: float, rungs: int,
                  fail_fast_minutes: int, require_resistance_break: bool=True,
-                 use_gslo_near_close: bool=True):
+                 use_gslo_near_close: bool=True, max_parallel: int=1):
         self.first_offset_pts = first_offset_pts
         self.step_pts = step_pts
         self.rungs = int(rungs)
         self.fail_fast_minutes = int(fail_fast_minutes)
         self.require_resistance_break = require_resistance_break
         self.use_gslo_near_close = use_gslo_near_close
+        self.max_parallel = max(1, int(max_parallel))
+
+def submit_rungs(levels: List[float], place: Callable[[float], Optional[str]],
+                 max_parallel: int = 1, label: str = "") -> Dict:
+    """
+    Places one rung per level with at most max_parallel requests in flight.
+
+    Keeps the sequential stop-on-failure rule: once any rung fails, no
+    further rungs are started (rungs already in flight still complete).
+    Returns {"tickets": [...] in rung order, "time_to_live": seconds until
+    the last submitted rung came back}.
+    """
+    start = time.monotonic()
+    tickets = {}
+    if max_parallel <= 1:
+        for i, level in enumerate(levels):
+            deal_ref = place(level)
+            tickets[i] = {"rung": i+1, "level": level, "deal_ref": deal_ref}
+            if not deal_ref:
+                logging.warning(f"Failed to place rung {i+1} for {label}")
+                break
+    else:
+        failed = False
+        with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+            pending = {}
+            nxt = 0
+            while nxt < len(levels) or pending:
+                while not failed and nxt < len(levels) and len(pending) < max_parallel:
+                    pending[pool.submit(place, levels[nxt])] = nxt
+                    nxt += 1
+                if not pending:
+                    break
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    i = pending.pop(fut)
+                    try:
+                        deal_ref = fut.result()
+                    except Exception as e:
+                        logging.error(f"Rung {i+1} for {label} raised: {e}")
+                        deal_ref = None
+                    tickets[i] = {"rung": i+1, "level": levels[i], "deal_ref": deal_ref}
+                    if not deal_ref:
+                        logging.warning(f"Failed to place rung {i+1} for {label}")
+                        failed = True
+                if failed:
+                    nxt = len(levels)
+    elapsed = time.monotonic() - start
+    return {"tickets": [tickets[i] for i in sorted(tickets)], "time_to_live": elapsed}
+
+def plan_ladder_changes(desired: List[Dict], live: List[Dict], tolerance: float = 0.01) -> Dict:
+    """
+    Works out the fewest requests that turn the live rungs into the desired ones.
+
+    desired: [{"level", "size"}, ...]; live: book orders for one
+    (epic, direction, type). A live rung within `tolerance` of a desired
+    level with the same size is kept. Remaining live rungs of matching size
+    are paired with remaining desired rungs in level order and moved with one
+    amend each (IG cannot amend size); the rest are cancelled, and desired
+    rungs still unmatched are placed. Rungs still waiting for a dealId can
+    be kept but not moved or cancelled; they are reported as pending and
+    hold back as many placements, so the next pass can move them instead
+    of doubling the ladder.
+    Returns {"keep", "amend": [(order, rung)], "cancel", "place", "pending"}.
+    """
+    want = sorted(desired, key=lambda r: float(r["level"]))
+    have = sorted(live, key=lambda o: float((o.get("workingOrderData") or {}).get("orderLevel") or 0.0))
+
+    def _level(o):
+        return float((o.get("workingOrderData") or {}).get("orderLevel") or 0.0)
+
+    def _size(o):
+        return float((o.get("workingOrderData") or {}).get("orderSize") or 0.0)
+
+    keep, todo = [], []
+    for rung in want:
+        lvl, size = float(rung["level"]), float(rung["size"])
+        match = next((o for o in have if abs(_level(o) - lvl) <= tolerance and _size(o) == size), None)
+        if match is not None:
+            have.remove(match)
+            keep.append(match)
+        else:
+            todo.append(rung)
+
+    pending = [o for o in have if not (o.get("workingOrderData") or {}).get("dealId")]
+    movable = [o for o in have if (o.get("workingOrderData") or {}).get("dealId")]
+    amend, place = [], []
+    for rung in todo:
+        o = next((o for o in movable if _size(o) == float(rung["size"])), None)
+        if o is not None:
+            movable.remove(o)
+            amend.append((o, rung))
+        else:
+            place.append(rung)
+    place = place[:max(0, len(place) - len(pending))]
+    return {"keep": keep, "amend": amend, "cancel": movable, "place": place, "pending": pending}
 
 def place_breakout_ladder(epic: str,
                           side: str,
@@ -28,14 +125,10 @@ def place_breakout_ladder(epic: str,
     else:
         base = px + params.first_offset_pts if side=="BUY" else px - params.first_offset_pts
 
-    tickets = []
-    for i in range(params.rungs):
-        level = base + i * params.step_pts if side == "BUY" else base - i * params.step_pts
-        use_gslo = params.use_gslo_near_close
-        deal_ref = place_stop_entry(epic, level, side, None, use_gslo)
-        tickets.append({"rung": i+1, "level": level, "deal_ref": deal_ref})
-        if not deal_ref:
-            logging.warning(f"Failed to place rung {i+1} for {epic}")
-            break
-    
-    return {"tickets": tickets}
+    levels = [base + i * params.step_pts if side == "BUY" else base - i * params.step_pts
+              for i in range(params.rungs)]
+    use_gslo = params.use_gslo_near_close
+    result = submit_rungs(levels, lambda level: place_stop_entry(epic, level, side, None, use_gslo),
+                          params.max_parallel, epic)
+    logging.info(f"Ladder for {epic}: {len(result['tickets'])} rungs live in {result['time_to_live'] * 1000:.0f}ms")
+    return result
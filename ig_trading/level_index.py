@@ -0,0 +1,138 @@
+# This file indexes swing-pivot support/resistance levels per epic.
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from data_feed.candle_store import bar_time, bid_price
+
+class _EpicLevels:
+    __slots__ = ("prices", "order", "recent", "last_time")
+
+    def __init__(self, strength: int):
+        self.prices: Dict[str, List[float]] = {"R": [], "S": []}  # sorted per kind, for bisect queries
+        self.order: deque = deque()            # (price, kind) oldest first, for expiry
+        self.recent: deque = deque(maxlen=2 * strength + 1)  # (high, low) of last closed bars
+        self.last_time = None
+
+class LevelIndex:
+    """
+    Swing-pivot levels per epic, kept in a sorted list for bisect lookups.
+
+    A bar is a swing high (resistance) when its high is above the highs of
+    `strength` bars on each side, and a swing low (support) likewise for
+    lows, so a pivot is confirmed `strength` bars after it forms. Each closed
+    bar costs O(strength) plus a sorted insert; levels within `merge_pts` of
+    an existing one of the same kind are folded into it, and only the newest
+    `max_levels` are kept. Resistance and support are kept in separate
+    sorted lists, so resistance_above() only returns swing highs and
+    support_below() only swing lows; no polarity flipping is applied.
+    """
+    def __init__(self, strength: int = 3, merge_pts: float = 0.0, max_levels: int = 200,
+                 resolution: str = "MINUTE"):
+        self.strength = int(strength)
+        self.merge_pts = float(merge_pts)
+        self.max_levels = int(max_levels)
+        self.resolution = resolution
+        self._epics: Dict[str, _EpicLevels] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, epic: str) -> _EpicLevels:
+        st = self._epics.get(epic)
+        if st is None:
+            st = self._epics[epic] = _EpicLevels(self.strength)
+        return st
+
+    def add_bar(self, epic: str, high: Optional[float], low: Optional[float], t=None) -> None:
+        """Feeds one closed bar; confirms the pivot `strength` bars back, if any."""
+        if high is None or low is None:
+            return
+        with self._lock:
+            st = self._state(epic)
+            if t is not None and st.last_time is not None and t <= st.last_time:
+                return
+            st.last_time = t
+            st.recent.append((float(high), float(low)))
+            if len(st.recent) < st.recent.maxlen:
+                return
+            k = self.strength
+            bars = list(st.recent)
+            mid_hi, mid_lo = bars[k]
+            others = bars[:k] + bars[k + 1:]
+            if all(mid_hi > h for h, _ in others):
+                self._insert(st, mid_hi, "R")
+            if all(mid_lo < l for _, l in others):
+                self._insert(st, mid_lo, "S")
+
+    def _insert(self, st: _EpicLevels, price: float, kind: str) -> None:
+        prices = st.prices[kind]
+        if self.merge_pts > 0 and prices:
+            i = bisect_left(prices, price)
+            for j in (i - 1, i):
+                if 0 <= j < len(prices) and abs(prices[j] - price) <= self.merge_pts:
+                    return
+        insort(prices, price)
+        st.order.append((price, kind))
+        while len(st.order) > self.max_levels:
+            old, old_kind = st.order.popleft()
+            lst = st.prices[old_kind]
+            i = bisect_left(lst, old)
+            if i < len(lst) and lst[i] == old:
+                del lst[i]
+
+    def feed_candles(self, epic: str, candles: Iterable[Dict], forming_last: bool = True) -> None:
+        """Adds closed IG candles newer than the last one seen (oldest first)."""
+        candles = list(candles)
+        if forming_last:
+            candles = candles[:-1]
+        st = self._epics.get(epic)
+        last = st.last_time if st is not None else None
+        start = len(candles)
+        while start > 0:
+            t = bar_time(candles[start - 1])
+            if last is not None and t is not None and t <= last:
+                break
+            start -= 1
+        for c in candles[start:]:
+            self.add_bar(epic, bid_price(c, "highPrice"), bid_price(c, "lowPrice"), bar_time(c))
+
+    def on_bar(self, epic: str, resolution: str, candle: Dict) -> None:
+        """BarAggregator listener."""
+        if resolution == self.resolution:
+            self.add_bar(epic, bid_price(candle, "highPrice"), bid_price(candle, "lowPrice"), bar_time(candle))
+
+    def resistance_above(self, epic: str, price: float) -> Optional[float]:
+        with self._lock:
+            st = self._epics.get(epic)
+            if st is None:
+                return None
+            res = st.prices["R"]
+            i = bisect_right(res, price)
+            return res[i] if i < len(res) else None
+
+    def support_below(self, epic: str, price: float) -> Optional[float]:
+        with self._lock:
+            st = self._epics.get(epic)
+            if st is None:
+                return None
+            sup = st.prices["S"]
+            i = bisect_left(sup, price)
+            return sup[i - 1] if i > 0 else None
+
+    def levels_within(self, epic: str, price: float, pts: float, kind: Optional[str] = None) -> List[float]:
+        """Sorted levels within pts of price; kind "R" or "S" limits it to one side's pivots."""
+        with self._lock:
+            st = self._epics.get(epic)
+            if st is None:
+                return []
+            out = []
+            for k in ((kind,) if kind else ("R", "S")):
+                lst = st.prices[k]
+                out.extend(lst[bisect_left(lst, price - pts):bisect_right(lst, price + pts)])
+            return sorted(out)
+
+    def levels(self, epic: str) -> List[Tuple[float, str]]:
+        """(price, "R"|"S") oldest first."""
+        with self._lock:
+            st = self._epics.get(epic)
+            return list(st.order) if st is not None else []
@@ -1,45 +1,207 @@
 # This file contains the core trading logic for orders.
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from requests import Timeout, RequestException
 import json
 import re, time, os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import logging
 
+from utils.retry import send_with_retry
+from ig_trading.working_orders import WorkingOrderBook, order_epic
+from ig_trading.ladder_engine import submit_rungs, plan_ladder_changes
+from ig_trading.deal_confirms import DealConfirmTracker
+
 def _safe_ref(text: str, maxlen: int = 30) -> str:
     """Alnum/underscore only, trimmed to IG's length limits."""
     s = re.sub(r"[^A-Za-z0-9_]+", "_", text)
     return s[:maxlen] or f"R{int(time.time())}"
 
+def _stop_fields(stop_distance: Optional[float], use_gslo: bool = False) -> Dict:
+    """Stop part of a working-order payload, shared by placements and amends."""
+    if stop_distance is not None:
+        return {"trailingStop": True, "trailingStopDistance": stop_distance, "guaranteedStop": False}
+    return {"guaranteedStop": use_gslo}
+
 class OrderStore:
     # This class was in trading.py, but is better placed here.
-    def __init__(self, path="orders.json"):
+    """
+    Order history kept as a compacted snapshot (path, plain JSON as before)
+    plus an append-only JSON-lines journal (path + ".journal").
+
+    add() appends one line, so its cost no longer grows with history size.
+    A background thread fsyncs the journal in batches every fsync_interval
+    seconds and folds it into the snapshot every compact_interval seconds
+    (or once it passes compact_lines). On startup the snapshot is loaded and
+    the journal replayed; a torn last line from a crash is skipped, and
+    entries the snapshot already holds are not applied twice.
+
+    Compaction only copies the records and rotates the journal (to
+    path + ".journal.old") under the lock; the snapshot is written and
+    swapped in outside it, so add() is never held up by a full dump. The
+    rotated journal is deleted once the new snapshot is in place, and
+    replayed first if a crash left it behind.
+    """
+    def __init__(self, path="orders.json", fsync_interval: float = 0.5,
+                 compact_interval: float = 300.0, compact_lines: int = 5000, background: bool = True):
         self.path = path
+        self.journal_path = path + ".journal"
+        self.old_journal_path = self.journal_path + ".old"
+        self.fsync_interval = fsync_interval
+        self.compact_interval = compact_interval
+        self.compact_lines = compact_lines
         self.orders = {}
+        self.by_ref = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._journal_lines = 0
+        self._last_compact = time.monotonic()
+        self._stop = threading.Event()
+
         if os.path.exists(path):
             with open(path) as f:
                 self.orders = json.load(f)
+        for epic, recs in self.orders.items():
+            for rec in recs:
+                self.by_ref[rec.get("deal_ref")] = {**rec, "epic": epic}
+        torn = self._replay()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        if torn:
+            # Terminate the torn line so the next entry starts on its own line.
+            self._journal.write("\n")
+
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._background, name="order-journal", daemon=True)
+            self._thread.start()
+
+    def _replay(self) -> bool:
+        """Applies journal entries; returns True if the file ends mid-line."""
+        line = ""
+        for path in (self.old_journal_path, self.journal_path):
+            if not os.path.exists(path):
+                continue
+            line = ""
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logging.warning(f"Skipping torn journal line in {path}")
+                        continue
+                    self._apply(entry)
+                    self._journal_lines += 1
+        return os.path.exists(self.journal_path) and bool(line) and not line.endswith("\n")
+
+    def _apply(self, entry):
+        if entry.get("op") == "add":
+            prev = self.by_ref.get(entry["deal_ref"])
+            if prev is not None and prev.get("timestamp") == entry["timestamp"]:
+                # Already in the snapshot: a crash after save()'s replace left the rotated journal behind.
+                return
+            rec = {"deal_ref": entry["deal_ref"], "order_type": entry["order_type"],
+                   "timestamp": entry["timestamp"]}
+            self.orders.setdefault(entry["epic"], []).append(rec)
+            self.by_ref[entry["deal_ref"]] = {**rec, "epic": entry["epic"]}
 
     def add(self, epic, order_type, deal_ref):
-        if epic not in self.orders:
-            self.orders[epic] = []
-        self.orders[epic].append({
-            "deal_ref": deal_ref,
-            "order_type": order_type,
-            "timestamp": time.time()
-        })
-        self.save()
+        entry = {"op": "add", "epic": epic, "deal_ref": deal_ref,
+                 "order_type": order_type, "timestamp": time.time()}
+        with self._lock:
+            self._apply(entry)
+            self._journal.write(json.dumps(entry) + "\n")
+            self._journal.flush()
+            self._journal_lines += 1
+            self._dirty = True
+        if self._thread is None:
+            self.sync()
+
+    def get(self, deal_ref):
+        return self.by_ref.get(deal_ref)
+
+    def for_epic(self, epic):
+        return list(self.orders.get(epic, []))
+
+    def sync(self):
+        """fsyncs journal lines written since the last sync."""
+        with self._lock:
+            if not self._dirty:
+                return
+            os.fsync(self._journal.fileno())
+            self._dirty = False
 
     def save(self):
-        with open(self.path, "w") as f:
-            json.dump(self.orders, f, indent=2)
+        """Writes the full snapshot atomically and starts a fresh journal."""
+        with self._save_lock:
+            with self._lock:
+                orders = {epic: list(recs) for epic, recs in self.orders.items()}
+                if self._dirty:
+                    # The rotated lines are the only copy until the snapshot lands.
+                    os.fsync(self._journal.fileno())
+                self._journal.close()
+                self._rotate_journal()
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+                self._journal_lines = 0
+                self._dirty = False
+                self._last_compact = time.monotonic()
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(orders, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            os.remove(self.old_journal_path)
+
+    def _rotate_journal(self):
+        if not os.path.exists(self.journal_path):
+            open(self.old_journal_path, "a").close()
+        elif not os.path.exists(self.old_journal_path):
+            os.replace(self.journal_path, self.old_journal_path)
+        else:
+            # An earlier save failed before its snapshot landed: keep those lines too.
+            with open(self.old_journal_path, "a", encoding="utf-8") as dst, \
+                    open(self.journal_path, encoding="utf-8") as src:
+                dst.write(src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.journal_path)
+
+    compact = save
+
+    def _background(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.sync()
+                due = time.monotonic() - self._last_compact >= self.compact_interval
+                if (self._journal_lines and (due or self._journal_lines >= self.compact_lines)
+                        or os.path.exists(self.old_journal_path)):
+                    self.save()
+            except Exception as e:
+                logging.error(f"Order journal maintenance failed: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.sync()
+        if self._journal_lines or os.path.exists(self.old_journal_path):
+            self.save()
+        self._journal.close()
 
 class OrderManager:
-    def __init__(self, session, headers, base_url, store_path="orders.json"):
+    def __init__(self, session, headers, base_url, store_path="orders.json", book_ttl: float = 3.0):
         self.session = session
         self.headers = headers
         self.base_url = base_url
         self.store = OrderStore(store_path)
+        self.book = WorkingOrderBook(self._fetch_working_orders, ttl=book_ttl)
+        # Every placement is confirmed in the background; see confirm().
+        self.confirms = DealConfirmTracker(session, headers, base_url)
+        self.confirms.add_listener(self._on_confirm)
+        # Optional PreTradeValidator; when set, every rung is checked and snapped before sending.
+        self.validator = None
 
     def place_stop_entry(
         self,
@@ -49,6 +211,7 @@ class OrderManager:
         size: float = 1.0,
         use_gslo: bool = False,
         stop_distance: float | None = None,
+        snap_level: bool = True,
         **kwargs,
     ):
         if "guaranteedStop" in kwargs and not use_gslo:
@@ -56,7 +219,20 @@ class OrderManager:
         if "dealDirection" in kwargs and not direction:
             direction = str(kwargs["dealDirection"])
 
-        lvl = round(float(level), 2)
+        if self.validator is not None:
+            chk = self.validator.check(epic, direction, level, size, stop_distance,
+                                       guaranteed=use_gslo and stop_distance is None,
+                                       trailing=stop_distance is not None, snap_level=snap_level)
+            if not chk.ok:
+                logging.warning(f"place_stop_entry blocked for {epic} at {level}: {chk.reason}")
+                return None
+            if chk.adjusted:
+                logging.info(f"Snapped {epic} rung ({', '.join(chk.adjusted)}): "
+                             f"{level}/{size}/{stop_distance} -> {chk.level}/{chk.size}/{chk.stop_distance}")
+            level, size, stop_distance = chk.level, chk.size, chk.stop_distance
+            lvl = chk.level
+        else:
+            lvl = round(float(level), 2)
         ref_base = f"STP_{direction}_{epic}_{int(lvl*100)}_{int(time.time()%1_000_000)}"
         deal_ref = _safe_ref(ref_base)
 
@@ -69,71 +245,233 @@ class OrderManager:
             "type": "STOP_ENTRY",
             "currencyCode": "GBP",
             "timeInForce": "GOOD_TILL_CANCELLED",
-            "guaranteedStop": use_gslo,
+            **_stop_fields(stop_distance, use_gslo),
         }
-        if stop_distance is not None:
-            payload["trailingStop"] = True
-            payload["trailingStopDistance"] = stop_distance
-            payload["guaranteedStop"] = False
-        
+
         h = self.headers.copy()
         h["Version"] = "2"
         try:
             r = self.session.post(f"{self.base_url}/workingorders/otc", headers=h, json=payload)
             if r.status_code in (200, 201, 202):
                 logging.info(f"Stop entry placed for {epic} at {level}. Deal ref: {deal_ref}")
-                return (r.json() or {}).get("dealReference") or payload["dealReference"]
+                ref = (r.json() or {}).get("dealReference") or payload.get("dealReference")
+                self.book.add_local(epic, direction, "STOP_ENTRY", lvl, size, deal_reference=ref)
+                if ref:
+                    self.confirms.track(ref)
+                return ref
             logging.warning(f"place_stop_entry failed: {r.status_code} {r.text}")
             return None
         except (Timeout, RequestException) as e:
             logging.error(f"place_stop_entry error: {e}")
             return None
 
+    def confirm(self, deal_reference: str, callback=None):
+        """Future (and optional callback) for a placement's DealConfirmation; does not block."""
+        return self.confirms.track(deal_reference, callback)
+
+    def _on_confirm(self, conf) -> None:
+        if conf.accepted and conf.deal_id:
+            self.book.set_deal_id(conf.deal_reference, conf.deal_id)
+        elif conf.status == "REJECTED":
+            self.book.remove_reference(conf.deal_reference)
+
+    def _snap_ladder(self, epic: str, direction: str, rungs: List[Dict],
+                     stop_distance: Optional[float]) -> Tuple[List[Dict], Optional[float]]:
+        """
+        Runs the validator over a whole ladder ([{"level", "size"}, ...]) so
+        rungs too near the price shift together instead of stacking. Refused
+        rungs are dropped. Returns (snapped rungs, snapped stop distance).
+        """
+        if self.validator is None or not rungs:
+            return rungs, stop_distance
+        checks = self.validator.check_ladder(epic, direction, [r["level"] for r in rungs],
+                                             [r["size"] for r in rungs], stop_distance,
+                                             trailing=stop_distance is not None)
+        snapped = []
+        for rung, chk in zip(rungs, checks):
+            if not chk.ok:
+                logging.warning(f"Ladder rung {epic} {rung['level']} dropped: {chk.reason}")
+                continue
+            snapped.append({**rung, "level": chk.level, "size": chk.size})
+            stop_distance = chk.stop_distance
+        return snapped, stop_distance
+
     def ensure_ladder(self, epic: str, base_level: float, size: float, count: int,
-                      gap: float, max_live: int, stop_distance: float, lowering: bool = True):
+                      gap: float, max_live: int, stop_distance: float, lowering: bool = False,
+                      max_parallel: int = 1) -> Optional[Dict]:
+        """
+        Keeps `count` BUY stop rungs at base_level + i * gap (at most max_live).
+        By default live rungs are left alone: nothing happens once max_live
+        are working, otherwise only missing ones are added. With lowering,
+        reconcile_ladder moves or cancels stale rungs instead; it treats every
+        BUY STOP_ENTRY on the epic as part of the ladder, including orders
+        placed by hand, so only opt in on epics the bot owns outright.
+        """
+        count = min(int(count), int(max_live))
+        levels = [round(base_level + i * float(gap), 2) for i in range(count)]
+        if lowering:
+            return self.reconcile_ladder(epic, [{"level": l, "size": size} for l in levels],
+                                         "BUY", stop_distance, max_parallel=max(1, max_parallel))
         live = self.list_epic_stop_buys(epic)
         if len(live) >= max_live:
-            return
-        to_place = max(0, int(count) - len(live))
-        for i in range(to_place):
-            level = round(base_level + i * float(gap), 2)
-            dr = self.place_stop_entry(epic, level, size, stop_distance=stop_distance)
+            return None
+        rungs, stop_distance = self._snap_ladder(
+            epic, "BUY", [{"level": l, "size": size} for l in levels[:max(0, count - len(live))]], stop_distance)
+        sizes = {r["level"]: r["size"] for r in rungs}
+
+        def _place(level):
+            # Already snapped as a ladder; a rung the price has since reached is refused, not stacked.
+            dr = self.place_stop_entry(epic, level, "BUY", sizes[level], stop_distance=stop_distance,
+                                       snap_level=False)
             if dr:
                 self.store.add(epic, "BUY_STOP_GTC", dr)
+            return dr
+
+        return submit_rungs([r["level"] for r in rungs], _place, max_parallel, epic)
+
+    def amend_order(self, deal_id: str, level: float, otype: str = "STOP_ENTRY", attempts: int = 3,
+                    stop_distance: Optional[float] = None, use_gslo: bool = False) -> Dict:
+        """
+        Moves a working order to a new level with PUT /workingorders/otc/{dealId}.
+        The new level goes through the validator like a placement; it is
+        refused, not pushed, if it sits inside the minimum distance. The stop
+        settings are sent the same way place_stop_entry sends them, so a moved
+        rung keeps the stop of a freshly placed one.
+        """
+        lvl = round(float(level), 2)
+        o = self.book.by_deal_id(deal_id)
+        if self.validator is not None and o is not None:
+            wod = o.get("workingOrderData") or {}
+            chk = self.validator.check(order_epic(o), wod.get("direction"), level, wod.get("orderSize"),
+                                       stop_distance, guaranteed=use_gslo and stop_distance is None,
+                                       trailing=stop_distance is not None, snap_level=False)
+            if not chk.ok:
+                logging.warning(f"Amend of {deal_id} to {level} blocked: {chk.reason}")
+                return {"dealId": deal_id, "level": lvl, "ok": False, "status": None,
+                        "attempts": 0, "error": chk.reason}
+            lvl, stop_distance = chk.level, chk.stop_distance
+        h = self.headers.copy()
+        h["Version"] = "2"
+        payload = {
+            "level": lvl,
+            "type": "LIMIT" if otype == "LIMIT_ENTRY" else "STOP",
+            "timeInForce": "GOOD_TILL_CANCELLED",
+            **_stop_fields(stop_distance, use_gslo),
+        }
+        r, tries, error = send_with_retry(
+            lambda: self.session.put(f"{self.base_url}/workingorders/otc/{deal_id}", headers=h, json=payload),
+            attempts=attempts, label=f"amend {deal_id}")
+        status = getattr(r, "status_code", None)
+        ok = status in (200, 201, 202)
+        if ok:
+            self.book.update_level(deal_id, lvl)
+            ref = (r.json() or {}).get("dealReference")
+            if ref:
+                self.confirms.track(ref)
+        else:
+            error = error or (r.text if r is not None else "no response")
+            logging.warning(f"Failed to amend order {deal_id}: {error}")
+        return {"dealId": deal_id, "level": lvl, "ok": ok, "status": status,
+                "attempts": tries, "error": None if ok else error}
+
+    def reconcile_ladder(self, epic: str, desired: List[Dict], direction: str = "BUY",
+                         stop_distance: Optional[float] = None, tolerance: float = 0.01,
+                         max_parallel: int = 4) -> Dict:
+        """
+        Brings the live STOP_ENTRY rungs for (epic, direction) in line with
+        `desired` ([{"level", "size"}, ...]) using the fewest requests: matching
+        rungs are kept, stale ones amended to a wanted level, extras cancelled
+        and the remainder placed. All operations run concurrently.
+        """
+        start = time.monotonic()
+        # Plan against the levels we would actually send, or snapped rungs look stale every pass.
+        desired, stop_distance = self._snap_ladder(epic, direction, desired, stop_distance)
+        # Cached book (bounded by its TTL): keeps our unconfirmed placements visible as pending.
+        live = self.book.for_epic(epic, direction, "STOP_ENTRY")
+        plan = plan_ladder_changes(desired, live, tolerance)
+
+        def _place(rung):
+            dr = self.place_stop_entry(epic, rung["level"], direction, rung["size"], stop_distance=stop_distance,
+                                       snap_level=False)
+            if dr:
+                self.store.add(epic, f"{direction}_STOP_GTC", dr)
+            return {"level": rung["level"], "size": rung["size"], "deal_ref": dr, "ok": bool(dr)}
+
+        jobs = ([("amend", lambda o=o, r=r: self.amend_order(
+                     o["workingOrderData"]["dealId"], r["level"], stop_distance=stop_distance))
+                 for o, r in plan["amend"]]
+                + [("cancel", lambda o=o: self.cancel_order(o["workingOrderData"]["dealId"], epic))
+                   for o in plan["cancel"]]
+                + [("place", lambda r=r: _place(r)) for r in plan["place"]])
+        results = {"amended": [], "cancelled": [], "placed": []}
+        if jobs:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(jobs)))) as pool:
+                futs = [(kind, pool.submit(fn)) for kind, fn in jobs]
+                for kind, fut in futs:
+                    results[{"amend": "amended", "cancel": "cancelled", "place": "placed"}[kind]].append(fut.result())
+        results.update(kept=len(plan["keep"]), pending=len(plan["pending"]), requests=len(jobs),
+                       elapsed=time.monotonic() - start)
+        logging.info(f"Ladder {epic} {direction}: kept {results['kept']}, amended {len(results['amended'])}, "
+                     f"cancelled {len(results['cancelled'])}, placed {len(results['placed'])} "
+                     f"in {results['elapsed'] * 1000:.0f}ms")
+        return results
 
     def cancel_all_for_epic(self, epic: str) -> int:
-        cancelled = 0
-        for o in self.list_all_working_orders():
-            md = o.get("marketData", {}) or {}
+        return sum(1 for r in self.cancel_all([epic]) if r["ok"])
+
+    def cancel_order(self, deal_id: str, epic: Optional[str] = None, attempts: int = 3) -> Dict:
+        """DELETEs one working order, retrying transient failures. A 404 counts as already gone."""
+        r, tries, error = send_with_retry(
+            lambda: self.session.delete(f"{self.base_url}/workingorders/otc/{deal_id}", headers=self.headers.copy()),
+            attempts=attempts, label=f"cancel {deal_id}")
+        status = getattr(r, "status_code", None)
+        ok = status in (200, 204, 404)
+        if ok:
+            self.book.remove(deal_id)
+            logging.info(f"Cancelled order for {epic}: {deal_id}" if status != 404 else
+                         f"Order {deal_id} for {epic} was already gone")
+        else:
+            error = error or (r.text if r is not None else "no response")
+            logging.warning(f"Failed to cancel order {deal_id}: {error}")
+        return {"dealId": deal_id, "epic": epic, "ok": ok, "status": status,
+                "attempts": tries, "error": None if ok else error}
+
+    def cancel_all(self, epics: Optional[List[str]] = None, max_parallel: int = 8) -> List[Dict]:
+        """
+        Cancels every working order (or only those on `epics`) from one fresh
+        /workingorders snapshot, with up to max_parallel DELETEs in flight.
+        Pacing comes from the session's RequestScheduler. Returns one result
+        dict per order.
+        """
+        wanted = set(epics) if epics is not None else None
+        targets = []
+        for o in self.book.all(refresh=True):
             wod = o.get("workingOrderData", {}) or {}
-            if md.get("epic") == epic:
-                try:
-                    r = self.session.delete(
-                        f"{self.base_url}/workingorders/otc/{wod['dealId']}",
-                        headers=self.headers.copy()
-                    )
-                    if r.status_code == 200:
-                        cancelled += 1
-                        logging.info(f"Cancelled order for {epic}: {wod['dealId']}")
-                    else:
-                        logging.warning(f"Failed to cancel order {wod['dealId']}: {r.text}")
-                except Exception as e:
-                    logging.error(f"Error cancelling order: {e}")
-        return cancelled
-
-    def list_all_working_orders(self) -> List[Dict]:
+            epic = order_epic(o)
+            if wod.get("dealId") and (wanted is None or epic in wanted):
+                targets.append((wod["dealId"], epic))
+        if not targets:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(targets)))) as pool:
+            results = list(pool.map(lambda t: self.cancel_order(*t), targets))
+        logging.info(f"Cancelled {sum(r['ok'] for r in results)}/{len(results)} working orders")
+        return results
+
+    def _fetch_working_orders(self) -> Optional[List[Dict]]:
         h = self.headers.copy()
         h["Version"] = "2"
         try:
             r = self.session.get(f"{self.base_url}/workingorders", headers=h)
             if r.status_code == 200:
                 return r.json().get("workingOrders", [])
+            logging.warning(f"Failed to fetch working orders: {r.status_code} {r.text}")
         except (Timeout, RequestException) as e:
             logging.error(f"Error fetching working orders: {e}")
-        return []
+        return None
+
+    def list_all_working_orders(self, refresh: bool = False) -> List[Dict]:
+        """Working orders from the cached book; refresh=True forces a GET."""
+        return self.book.all(refresh=refresh)
 
     def list_epic_stop_buys(self, epic: str) -> List[Dict]:
-        return [o for o in self.list_all_working_orders()
-                if o.get("marketData", {}).get("epic") == epic
-                and o.get("workingOrderData", {}).get("direction") == "BUY"
-                and o.get("workingOrderData", {}).get("type") == "STOP_ENTRY"]
+        return self.book.for_epic(epic, "BUY", "STOP_ENTRY")
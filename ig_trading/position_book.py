@@ -0,0 +1,139 @@
+# This file caches the /positions list, indexed by epic and dealId.
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+def position_epic(p: Dict) -> Optional[str]:
+    return (p.get("market") or {}).get("epic")
+
+def position_deal_id(p: Dict) -> Optional[str]:
+    return (p.get("position") or {}).get("dealId")
+
+class PositionBook:
+    """
+    Snapshot of GET /positions with indexes by epic and by dealId.
+
+    Like WorkingOrderBook, reads refetch only when the snapshot is older
+    than ttl, and our own closes and amends are applied locally (remove /
+    reduce / update) in between. on_trade_update() applies streamed OPU
+    (open position update) messages the same way.
+    """
+    def __init__(self, fetch: Callable[[], Optional[List[Dict]]], ttl: float = 3.0):
+        self.fetch = fetch
+        self.ttl = float(ttl)
+        self.fetched_at: Optional[float] = None
+        self.fetches = 0
+        self._by_deal: Dict[str, Dict] = {}
+        self._by_epic: Dict[str, List[Dict]] = {}
+        self._lock = threading.RLock()
+
+    def _fresh(self) -> bool:
+        return self.fetched_at is not None and time.monotonic() - self.fetched_at < self.ttl
+
+    def refresh(self, strict: bool = False) -> Optional[List[Dict]]:
+        """Refetches the book. With strict, a failed fetch returns None instead of the old view."""
+        positions = self.fetch()
+        with self._lock:
+            self.fetches += 1
+            if positions is None:
+                # Fetch failed: keep serving the old view rather than reporting flat.
+                return None if strict else list(self._by_deal.values())
+            self._by_deal.clear()
+            self._by_epic.clear()
+            for p in positions:
+                self._index(p)
+            self.fetched_at = time.monotonic()
+            return list(self._by_deal.values())
+
+    def _ensure(self, refresh: bool) -> None:
+        if refresh or not self._fresh():
+            self.refresh()
+
+    def _index(self, p: Dict) -> None:
+        deal_id = position_deal_id(p)
+        if deal_id in self._by_deal:
+            self._unindex(deal_id)
+        self._by_deal[deal_id] = p
+        self._by_epic.setdefault(position_epic(p), []).append(p)
+
+    def _unindex(self, deal_id: str) -> Optional[Dict]:
+        p = self._by_deal.pop(deal_id, None)
+        if p is None:
+            return None
+        lst = self._by_epic.get(position_epic(p), [])
+        for i, x in enumerate(lst):
+            if x is p:
+                del lst[i]
+                break
+        if not lst:
+            self._by_epic.pop(position_epic(p), None)
+        return p
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.fetched_at = None
+
+    def all(self, refresh: bool = False) -> List[Dict]:
+        self._ensure(refresh)
+        with self._lock:
+            return list(self._by_deal.values())
+
+    def for_epic(self, epic: str, refresh: bool = False) -> List[Dict]:
+        self._ensure(refresh)
+        with self._lock:
+            return list(self._by_epic.get(epic, []))
+
+    def by_epic(self, refresh: bool = False) -> Dict[str, Dict]:
+        """One position per epic (the most recently indexed), as get_open_positions_map returns."""
+        self._ensure(refresh)
+        with self._lock:
+            return {e: lst[-1] for e, lst in self._by_epic.items() if lst}
+
+    def by_deal_id(self, deal_id: str, refresh: bool = False) -> Optional[Dict]:
+        self._ensure(refresh)
+        with self._lock:
+            return self._by_deal.get(deal_id)
+
+    def remove(self, deal_id: str) -> bool:
+        with self._lock:
+            return self._unindex(deal_id) is not None
+
+    def reduce(self, deal_id: str, size: float) -> None:
+        """Applies a (partial) close of `size`; drops the position when nothing is left."""
+        with self._lock:
+            p = self._by_deal.get(deal_id)
+            if p is None:
+                return
+            left = float(p["position"].get("size") or 0.0) - float(size)
+            if left <= 1e-9:
+                self._unindex(deal_id)
+            else:
+                p["position"]["size"] = left
+
+    def update(self, deal_id: str, **fields) -> bool:
+        """Applies our own amend (e.g. stopLevel=..., limitLevel=...) to the cached position."""
+        with self._lock:
+            p = self._by_deal.get(deal_id)
+            if p is None:
+                return False
+            p["position"].update(fields)
+            return True
+
+    def on_trade_update(self, opu: Dict) -> None:
+        """Applies a streamed OPU payload (dealId, epic, status OPEN/UPDATED/DELETED, ...)."""
+        deal_id = opu.get("dealId")
+        if not deal_id:
+            return
+        status = opu.get("status")
+        with self._lock:
+            if status == "DELETED":
+                self._unindex(deal_id)
+                return
+            fields = {k: opu[k] for k in ("direction", "size", "level", "stopLevel", "limitLevel")
+                      if opu.get(k) is not None}
+            p = self._by_deal.get(deal_id)
+            if p is None:
+                fields["dealId"] = deal_id
+                self._index({"position": fields, "market": {"epic": opu.get("epic")}})
+            else:
+                p["position"].update(fields)
@@ -5,40 +5,38 @@ from typing import Dict, List, Optional
 import logging
 import json
 
+from utils.retry import send_with_retry
+from ig_trading.position_book import PositionBook
+
 class PositionManager:
-    def __init__(self, session, headers, base_url):
+    def __init__(self, session, headers, base_url, book_ttl: float = 3.0):
         self.session = session
         self.headers = headers
         self.base_url = base_url
+        self.book = PositionBook(self._fetch_positions, ttl=book_ttl)
 
-    def get_open_position(self, epic):
+    def _fetch_positions(self) -> Optional[List[Dict]]:
         headers = self.headers.copy()
         headers["Version"] = "2"
         try:
             r = self.session.get(f"{self.base_url}/positions", headers=headers)
             if r.status_code == 200:
-                for p in r.json().get("positions", []):
-                    if p["market"]["epic"] == epic:
-                        return p
+                return r.json().get("positions", [])
+            logging.warning(f"Fetching open positions failed: {r.status_code} {r.text}")
         except (Timeout, RequestException) as e:
             logging.error(f"Error fetching open positions: {e}")
         return None
 
-    def get_open_positions_map(self) -> Dict[str, Dict]:
+    def get_open_position(self, epic, refresh: bool = False):
+        positions = self.book.for_epic(epic, refresh=refresh)
+        return positions[0] if positions else None
+
+    def get_open_positions_map(self, refresh: bool = False) -> Dict[str, Dict]:
         """Returns a dict of open positions keyed by epic."""
-        positions = self.list_all_open_positions()
-        return {p["market"]["epic"]: p for p in positions}
+        return self.book.by_epic(refresh=refresh)
 
-    def list_all_open_positions(self) -> List[Dict]:
-        headers = self.headers.copy()
-        headers["Version"] = "2"
-        try:
-            r = self.session.get(f"{self.base_url}/positions", headers=headers)
-            if r.status_code == 200:
-                return r.json().get("positions", [])
-        except (Timeout, RequestException) as e:
-            logging.error(f"Error fetching open positions: {e}")
-        return []
+    def list_all_open_positions(self, refresh: bool = False) -> List[Dict]:
+        return self.book.all(refresh=refresh)
 
     def close_position_by_epic(self, epic: str, reason: str = "") -> bool:
         """Closes a position using the epic identifier."""
@@ -54,6 +52,15 @@ class PositionManager:
         return self.close_position(deal_id, direction, size)
 
     def close_position(self, deal_id: str, direction: str, size: float) -> bool:
+        return self.close_deal(deal_id, direction, size, attempts=1)["ok"]
+
+    def close_deal(self, deal_id: str, direction: str, size: float, attempts: int = 3,
+                   epic: Optional[str] = None) -> Dict:
+        """
+        Market-closes one deal, retrying transient failures, and returns a
+        result dict with the dealReference to confirm. A 404 means the deal
+        is already gone.
+        """
         headers = self.headers.copy()
         headers["Version"] = "3"
         payload = {
@@ -63,23 +70,31 @@ class PositionManager:
             "size": size,
             "timeInForce": "FILL_OR_KILL",
         }
-        try:
-            r = self.session.post(f"{self.base_url}/positions/otc", headers=headers, json=payload)
-            if r.status_code in (200, 202):
-                return True
-            else:
-                logging.warning(f"Failed to close position {deal_id}: {r.status_code} {r.text}")
-                return False
-        except (Timeout, RequestException) as e:
-            logging.error(f"Request failed to close position {deal_id}: {e}")
-            return False
-            
+        r, tries, error = send_with_retry(
+            lambda: self.session.post(f"{self.base_url}/positions/otc", headers=headers, json=payload),
+            attempts=attempts, label=f"close {deal_id}")
+        status = getattr(r, "status_code", None)
+        ok = status in (200, 202, 404)
+        ref = None
+        if status in (200, 202):
+            self.book.reduce(deal_id, size)
+            ref = (r.json() or {}).get("dealReference")
+        elif status == 404:
+            self.book.remove(deal_id)
+        else:
+            error = error or (f"{status} {r.text}" if r is not None else "no response")
+            logging.warning(f"Failed to close position {deal_id}: {error}")
+        return {"dealId": deal_id, "epic": epic, "ok": ok, "status": status, "attempts": tries,
+                "dealReference": ref, "error": None if ok else error}
+
     def set_manual_trailing_stop(self, deal_id, stop_level):
         headers = self.headers.copy()
         headers["Version"] = "2"
         data = {"stopLevel": stop_level}
         try:
             r = self.session.put(f"{self.base_url}/positions/otc/{deal_id}", headers=headers, json=data)
+            if r.status_code == 200:
+                self.book.update(deal_id, stopLevel=stop_level)
             logging.info(f"Manual trailing stop set at {stop_level}: {r.status_code} {r.text}")
         except Exception as e:
             logging.error(f"Error setting trailing stop: {e}")
@@ -96,6 +111,10 @@ class PositionManager:
             return False
         try:
             r = self.session.put(f"{self.base_url}/positions/otc/{deal_id}", headers=headers, json=payload)
+            if r.status_code == 200:
+                self.book.update(deal_id, **payload)
             logging.info(f"Amended position {deal_id}: {r.status_code} {r.text}")
+            return r.status_code == 200
         except Exception as e:
             logging.error(f"Error amending position: {e}")
+            return False
@@ -0,0 +1,120 @@
+# This file tracks rolling N-bar highs/lows incrementally for breakout detection.
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from data_feed.candle_store import bar_time, bid_price
+
+class RollingExtremes:
+    """
+    Rolling max of highs and min of lows over the last `window` bars.
+
+    Uses monotonic deques of (seq, value), so push() and update() are
+    amortised O(1) and high()/low() are O(1). Bars are numbered by an
+    increasing sequence; update() revises the newest (still forming) bar,
+    whose high can only rise and low can only fall.
+    """
+    def __init__(self, window: int):
+        self.window = int(window)
+        self.seq = -1
+        self.last_time: Optional[datetime] = None
+        self._hi: deque = deque()
+        self._lo: deque = deque()
+
+    def push(self, high: float, low: float, t: Optional[datetime] = None) -> None:
+        self.seq += 1
+        self.last_time = t
+        self._add(high, low)
+        cutoff = self.seq - self.window
+        while self._hi and self._hi[0][0] <= cutoff:
+            self._hi.popleft()
+        while self._lo and self._lo[0][0] <= cutoff:
+            self._lo.popleft()
+
+    def update(self, high: float, low: float) -> None:
+        if self.seq < 0:
+            self.push(high, low)
+            return
+        self._add(high, low)
+
+    def _add(self, high: float, low: float) -> None:
+        s = self.seq
+        if high is not None and high == high:
+            while self._hi and self._hi[-1][1] <= high:
+                self._hi.pop()
+            self._hi.append((s, high))
+        if low is not None and low == low:
+            while self._lo and self._lo[-1][1] >= low:
+                self._lo.pop()
+            self._lo.append((s, low))
+
+    def _first_seq(self) -> int:
+        return max(0, self.seq - self.window + 1)
+
+    def high(self) -> Tuple[Optional[float], Optional[int]]:
+        """(value, index) with index counted from the oldest bar in the window."""
+        if not self._hi:
+            return None, None
+        s, v = self._hi[0]
+        return v, s - self._first_seq()
+
+    def low(self) -> Tuple[Optional[float], Optional[int]]:
+        if not self._lo:
+            return None, None
+        s, v = self._lo[0]
+        return v, s - self._first_seq()
+
+class RollingExtremesBook:
+    """
+    One RollingExtremes per (epic, resolution, window), fed from candle
+    windows (only bars newer than the last seen are processed) or from
+    BarAggregator bar closes.
+    """
+    def __init__(self):
+        self._trackers: Dict[Tuple[str, str, int], RollingExtremes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, epic: str, resolution: str, window: int) -> Optional[RollingExtremes]:
+        return self._trackers.get((epic, resolution, int(window)))
+
+    def feed_candles(self, epic: str, resolution: str, window: int, candles: Iterable[Dict]) -> RollingExtremes:
+        """Brings the tracker up to date with an IG candle list (oldest first)."""
+        candles = list(candles)
+        key = (epic, resolution, int(window))
+        with self._lock:
+            tr = self._trackers.get(key)
+            first_t = bar_time(candles[0]) if candles else None
+            if tr is None or tr.last_time is None or (first_t is not None and tr.last_time < first_t):
+                # New tracker, or a gap longer than the window: rebuild from scratch.
+                tr = self._trackers[key] = RollingExtremes(window)
+                start = 0
+            else:
+                # Only the tail newer than (or equal to) the last seen bar needs work.
+                start = len(candles)
+                while start > 0:
+                    t = bar_time(candles[start - 1])
+                    if t is not None and t < tr.last_time:
+                        break
+                    start -= 1
+            for c in candles[start:]:
+                t = bar_time(c)
+                h = bid_price(c, "highPrice")
+                l = bid_price(c, "lowPrice")
+                if tr.last_time is not None and t == tr.last_time:
+                    tr.update(h, l)
+                else:
+                    tr.push(h, l, t)
+            return tr
+
+    def on_bar(self, epic: str, resolution: str, candle: Dict) -> None:
+        """BarAggregator listener: pushes a closed bar into every matching tracker."""
+        t = bar_time(candle)
+        with self._lock:
+            for (e, res, _), tr in self._trackers.items():
+                if e != epic or res != resolution:
+                    continue
+                if tr.last_time is not None and t is not None and t <= tr.last_time:
+                    tr.update(bid_price(candle, "highPrice"), bid_price(candle, "lowPrice"))
+                else:
+                    tr.push(bid_price(candle, "highPrice"), bid_price(candle, "lowPrice"), t)
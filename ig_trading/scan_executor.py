@@ -0,0 +1,126 @@
+# This file fans per-epic scan work out over a bounded thread pool.
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterable, Optional
+
+class ScanResult:
+    __slots__ = ("epic", "ok", "value", "error", "elapsed")
+
+    def __init__(self, epic: str, ok: bool, value: Any = None, error: Optional[str] = None, elapsed: float = 0.0):
+        self.epic = epic
+        self.ok = ok
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        state = "ok" if self.ok else self.error
+        return f"ScanResult({self.epic!r}, {state}, {self.elapsed * 1000:.0f}ms)"
+
+class ScanReport:
+    def __init__(self, results: Dict[str, ScanResult], cycle_time: float):
+        self.results = results
+        self.cycle_time = cycle_time
+
+    @property
+    def values(self) -> Dict[str, Any]:
+        return {e: r.value for e, r in self.results.items() if r.ok}
+
+    @property
+    def failures(self) -> Dict[str, str]:
+        return {e: r.error for e, r in self.results.items() if not r.ok}
+
+    def summary(self) -> str:
+        n = len(self.results)
+        timeouts = sum(1 for r in self.results.values() if r.error == "timeout")
+        errors = len(self.failures) - timeouts
+        slowest = max((r.elapsed for r in self.results.values()), default=0.0)
+        return (f"{n} epics in {self.cycle_time:.2f}s "
+                f"(slowest {slowest:.2f}s, {errors} errors, {timeouts} timeouts)")
+
+class _Task:
+    __slots__ = ("started", "thread", "waited")
+
+    def __init__(self):
+        self.started: Optional[float] = None
+        self.thread: Optional[int] = None
+        self.waited = 0.0   # wait_clock(thread) when the task started
+
+class ScanExecutor:
+    """
+    Runs fn(epic) for every epic on a persistent pool of at most max_workers
+    threads and gathers the results with a per-task timeout. A task that
+    overruns is reported as "timeout" and left to finish in the background;
+    the pool is not torn down between cycles.
+
+    Request pacing is left to the session's RequestScheduler, so the pool
+    size only bounds how many requests can be waiting at once. Pass the
+    scheduler's thread_wait as wait_clock and time a task spends waiting
+    for allowance is left out of its timeout: a task is only timed while it
+    is actually working, so pacing a large watchlist does not read as
+    timeouts.
+    """
+    def __init__(self, max_workers: int = 8, wait_clock: Optional[Callable[[int], float]] = None):
+        self.max_workers = int(max_workers)
+        self.wait_clock = wait_clock
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scan")
+        self.last_report: Optional[ScanReport] = None
+
+    def run(self, epics: Iterable[str], fn: Callable[[str], Any], timeout: float = 10.0) -> ScanReport:
+        start = time.monotonic()
+        epics = list(dict.fromkeys(epics))
+        results: Dict[str, ScanResult] = {}
+        tasks: Dict[Any, _Task] = {}
+        pending = {}
+        for epic in epics:
+            task = _Task()
+            fut = self._pool.submit(self._timed, fn, epic, task, self.wait_clock)
+            pending[fut] = epic
+            tasks[fut] = task
+
+        # A task's clock starts when the pool picks it up, not when it was queued,
+        # and stops while it waits for request allowance.
+        while pending:
+            now = time.monotonic()
+            next_deadline = None
+            for fut, epic in list(pending.items()):
+                task = tasks[fut]
+                if fut.done() or task.started is None:
+                    continue
+                used = now - task.started
+                if self.wait_clock is not None and task.thread is not None:
+                    used -= self.wait_clock(task.thread) - task.waited
+                if used >= timeout:
+                    results[epic] = ScanResult(epic, False, error="timeout", elapsed=now - task.started)
+                    del pending[fut]
+                    continue
+                d = now + timeout - used
+                next_deadline = d if next_deadline is None else min(next_deadline, d)
+            if not pending:
+                break
+            wait_for = 0.05 if next_deadline is None else max(0.0, min(0.05, next_deadline - now))
+            done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+            for fut in done:
+                epic = pending.pop(fut)
+                ok, value, error, elapsed = fut.result()
+                results[epic] = ScanResult(epic, ok, value, error, elapsed)
+
+        report = ScanReport({e: results[e] for e in epics if e in results}, time.monotonic() - start)
+        self.last_report = report
+        return report
+
+    @staticmethod
+    def _timed(fn, epic, task: _Task, wait_clock):
+        task.thread = threading.get_ident()
+        task.waited = wait_clock(task.thread) if wait_clock is not None else 0.0
+        t0 = task.started = time.monotonic()
+        try:
+            return True, fn(epic), None, time.monotonic() - t0
+        except Exception as e:
+            logging.error(f"Scan task failed for {epic}: {e}")
+            return False, None, str(e) or e.__class__.__name__, time.monotonic() - t0
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,32 +1,147 @@
 # This file is for market scanning and analysis.
 import logging
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 from typing import Optional, List, Dict
 import requests
 
+from data_feed.candle_decoder import decode_candles
+from ig_trading.rolling_extremes import RollingExtremesBook
+from ig_trading.level_index import LevelIndex
+
 class Scanner:
     def __init__(self, market_data):
         self.md = market_data
+        self.extremes = RollingExtremesBook()
+        self.levels = LevelIndex()
+
+    def refresh_watchlist(self, watchlist: List[str]) -> Dict[str, Dict]:
+        """Warms the snapshot cache for a whole watchlist in bulk requests."""
+        return self.md.get_market_snapshots(watchlist, refresh=True)
 
     def get_ohlc(self, epic, resolution="MINUTE", lookback=200):
-        prices = self.md.get_prices(epic, resolution=resolution, max_points=lookback)
+        prices = self.md.get_price_window(epic, resolution=resolution, max_points=lookback)
         return prices or []
 
-    def recent_high_low(self, epic, lookback=200):
-        ohlc = self.get_ohlc(epic, lookback=lookback)
+    def recent_high_low(self, epic, lookback=200, resolution="MINUTE"):
+        ohlc = self.get_ohlc(epic, resolution=resolution, lookback=lookback)
         if not ohlc:
             return None, None, None, None
-        highs = [(i, float(c["highPrice"]["bid"])) for i, c in enumerate(ohlc)]
-        lows  = [(i, float(c["lowPrice"]["bid"])) for i, c in enumerate(ohlc)]
-        i_hi, v_hi = max(highs, key=lambda x: x[1])
-        i_lo, v_lo = min(lows,  key=lambda x: x[1])
+        # Only bars newer than the tracker's last one are processed.
+        tracker = self.extremes.feed_candles(epic, resolution, lookback, ohlc)
+        v_hi, i_hi = tracker.high()
+        v_lo, i_lo = tracker.low()
         return v_hi, v_lo, i_hi, i_lo
 
-    def is_breaking_high(self, epic, buffer=0.0, lookback=200):
+    def get_recent_resistance(self, epic, lookback=200) -> Optional[float]:
+        """Callback for place_breakout_ladder: the rolling lookback high."""
+        v_hi, _, _, _ = self.recent_high_low(epic, lookback)
+        return v_hi
+
+    def is_breaking_high(self, epic, buffer=0.0, lookback=200, market: Optional[Dict] = None):
+        """
+        True if the offer is above the lookback high plus buffer. `market` is
+        this epic's entry from a get_market_snapshots prefetch; its prices
+        are used (unless a live tick is streaming) instead of a cache read
+        that may have expired while the scan was waiting its turn.
+        """
         v_hi, _, _, _ = self.recent_high_low(epic, lookback)
         if v_hi is None:
             return False
-        _, _, bid, offer = self.md.get_market_details(epic)
-        if bid is None or offer is None:
+        offer = _snap_price(market, "offer")
+        if self.md._live_tick(epic) is not None or np.isnan(offer):
+            _, _, _, offer = self.md.get_market_details(epic)
+        if offer is None:
             return False
         return offer > v_hi + buffer
+
+    def get_nearest_resistance(self, epic, price: Optional[float] = None, lookback=200) -> Optional[float]:
+        """
+        Ladder callback: the nearest swing-pivot resistance above price (the
+        current mid by default), falling back to the rolling lookback high.
+        Only bars closed since the last call are added to the level index.
+        """
+        ohlc = self.get_ohlc(epic, lookback=lookback)
+        self.levels.feed_candles(epic, ohlc)
+        if price is None:
+            price = self.md.get_mid_price(epic)
+        level = self.levels.resistance_above(epic, price) if price is not None else None
+        if level is not None:
+            return level
+        return self.get_recent_resistance(epic, lookback)
+
+    def _pack_high_low(self, watchlist: List[str], resolution: str, lookback: int, max_workers: int = 16):
+        """
+        Stacks each epic's last `lookback` bid highs/lows into right-aligned,
+        NaN-padded rows. Candles are fetched concurrently (pacing is left to
+        the session's RequestScheduler); an epic whose fetch fails stays NaN.
+        """
+        highs = np.full((len(watchlist), lookback), np.nan)
+        lows = np.full((len(watchlist), lookback), np.nan)
+
+        def _one(epic):
+            try:
+                return decode_candles(self.get_ohlc(epic, resolution=resolution, lookback=lookback))
+            except Exception as e:
+                logging.error(f"Candle fetch failed for {epic}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(watchlist)))) as pool:
+            decoded = list(pool.map(_one, watchlist))
+        for row, cols in enumerate(decoded):
+            if cols is None:
+                continue
+            h, l = cols["bid_high"][-lookback:], cols["bid_low"][-lookback:]
+            if len(h):
+                highs[row, lookback - len(h):] = h
+                lows[row, lookback - len(l):] = l
+        return highs, lows
+
+    def scan_breakouts(self, watchlist: List[str], lookback: int = 200, buffer: float = 0.0,
+                       resolution: str = "MINUTE", max_workers: int = 16) -> pd.DataFrame:
+        """
+        Breakout scan over a whole watchlist in one vectorised pass.
+
+        Returns a DataFrame indexed by epic with high/low over the lookback
+        (and their bar index, 0 = oldest), current bid/offer, a breakout flag
+        (offer > high + buffer) and the distance above the high in points and
+        percent. Breakouts come first, strongest first.
+        """
+        watchlist = list(dict.fromkeys(watchlist))
+        cols = ["high", "low", "i_high", "i_low", "bid", "offer", "breakout", "distance", "distance_pct"]
+        if not watchlist:
+            return pd.DataFrame(columns=cols)
+
+        highs, lows = self._pack_high_low(watchlist, resolution, lookback, max_workers)
+        snaps = self.md.get_market_snapshots(watchlist)
+        bid = np.array([_snap_price(snaps.get(e), "bid") for e in watchlist])
+        offer = np.array([_snap_price(snaps.get(e), "offer") for e in watchlist])
+
+        has_data = ~np.all(np.isnan(highs), axis=1)
+        # nanargmax raises on all-NaN rows, so fill those with -inf/+inf first.
+        i_hi = np.where(has_data, np.argmax(np.where(np.isnan(highs), -np.inf, highs), axis=1), -1)
+        i_lo = np.where(has_data, np.argmin(np.where(np.isnan(lows), np.inf, lows), axis=1), -1)
+        rows = np.arange(len(watchlist))
+        v_hi = np.where(has_data, highs[rows, np.maximum(i_hi, 0)], np.nan)
+        v_lo = np.where(has_data, lows[rows, np.maximum(i_lo, 0)], np.nan)
+        # Report indices relative to the epic's own (unpadded) history.
+        pad = np.isnan(highs).argmin(axis=1)
+        i_hi = np.where(has_data, i_hi - pad, -1)
+        i_lo = np.where(has_data, i_lo - pad, -1)
+
+        distance = offer - (v_hi + buffer)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            distance_pct = distance / v_hi * 100.0
+        breakout = np.nan_to_num(distance, nan=-np.inf) > 0
+
+        table = pd.DataFrame({
+            "high": v_hi, "low": v_lo, "i_high": i_hi, "i_low": i_lo,
+            "bid": bid, "offer": offer, "breakout": breakout,
+            "distance": distance, "distance_pct": distance_pct,
+        }, index=pd.Index(watchlist, name="epic"))
+        return table.sort_values(["breakout", "distance_pct"], ascending=[False, False], na_position="last")
+
+def _snap_price(market: Optional[Dict], side: str) -> float:
+    v = ((market or {}).get("snapshot") or {}).get(side)
+    return float(v) if v is not None else np.nan
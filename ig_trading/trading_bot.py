@@ -1,8 +1,9 @@
 # This file contains the main TradingBot class.
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from requests import Timeout, RequestException
-from typing import Optional, List
+from typing import Optional, List, Dict
 import pandas as pd
 import logging
 import os
@@ -13,31 +14,254 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 
 from auth.ig_session import IGSession
 from data_feed.market_data import MarketData
+from data_feed.streaming import LightstreamerClient, PriceStream, TradeStream
+from data_feed.bar_aggregator import BarAggregator
+from data_feed.candle_archive import CandleArchive
+from utils.coalescing import CoalescingSession
+from utils.rate_limiter import RequestScheduler
 from ig_trading.order_manager import OrderManager, OrderStore
 from ig_trading.position_manager import PositionManager
 from ig_trading.scanner import Scanner
+from ig_trading.scan_executor import ScanExecutor, ScanReport
+from ig_trading.dealing_rules import PreTradeValidator
+from ig_trading.working_orders import order_epic
+from ig_trading.trailing_stops import TrailingStopEngine
+from ig_trading.indicators import IndicatorEngine
 
 class TradingBot:
-    def __init__(self, mode: str = "demo", default_stop_distance: float = 8.0, store_path: str = "orders.json"):
+    def __init__(self, mode: str = "demo", default_stop_distance: float = 8.0, store_path: str = "orders.json",
+                 archive_path: Optional[str] = "candle_archive", scan_workers: int = 8,
+                 indicators: Optional[IndicatorEngine] = None):
         self.session_handler = IGSession(mode=mode)
-        self.md = MarketData(self.session_handler.session, self.session_handler.get_headers(), self.session_handler.get_base_url())
-        self.pm = PositionManager(self.session_handler.session, self.session_handler.get_headers(), self.session_handler.get_base_url())
+        # Shared by all managers: identical concurrent GETs collapse into one call,
+        # and whatever is left is paced to IG's request allowances.
+        self.scheduler = RequestScheduler(self.session_handler.session)
+        self.http = CoalescingSession(self.scheduler)
+        archive = CandleArchive(archive_path) if archive_path else None
+        self.md = MarketData(self.http, self.session_handler.get_headers(), self.session_handler.get_base_url(),
+                             archive=archive)
+        self.pm = PositionManager(self.http, self.session_handler.get_headers(), self.session_handler.get_base_url())
+        self.scanner = Scanner(self.md)
+        self.scan_executor = ScanExecutor(max_workers=scan_workers, wait_clock=self.scheduler.thread_wait)
+        # Per-epic EMA/RSI, seeded from history by rank_watchlist and then fed closed bars by the stream.
+        self.indicators = indicators or IndicatorEngine()
         self.om = None  # set after authenticate()
 
+        self.stream = None  # PriceStream, set by start_streaming()
+        self.trades = None  # TradeStream on the same connection, feeds the position book
+        self.trailing = None  # TrailingStopEngine, set by start_trailing()
+        self.bar_aggregator = None
+
         self.default_stop_distance = default_stop_distance
         self.store_path = store_path
 
     def authenticate(self) -> bool:
         if self.session_handler.login():
-            self.om = OrderManager(self.session_handler.session, self.session_handler.get_headers(), self.session_handler.get_base_url(), self.store_path)
+            self.om = OrderManager(self.http, self.session_handler.get_headers(), self.session_handler.get_base_url(), self.store_path)
+            self.om.validator = PreTradeValidator(self.md)
             return True
         return False
         
     def logout(self) -> None:
+        self.stop_streaming()
+        if self.om is not None:
+            # Flush the order journal into the snapshot before the manager goes away.
+            self.om.store.close()
+            self.om.confirms.shutdown()
         self.session_handler.logout()
 
+    def flatten_all(self, max_parallel: int = 16, confirm_timeout: float = 15.0) -> Dict:
+        """
+        Kill switch: closes every open position and cancels every working
+        order. Both lists are snapshotted once, then all closes and cancels
+        run concurrently (paced by the scheduler's trading allowance, with
+        transient failures retried) and each close is confirmed. Finally
+        both lists are fetched again: the account is only reported flat if
+        both fetches succeed and come back empty, so a failed snapshot can
+        never read as flat. Returns {"positions", "orders", "rejected",
+        "remaining", "errors", "flat", "time_to_flat"}.
+        """
+        start = time.monotonic()
+        errors = []
+        positions, orders = self._snapshot_open()
+        if positions is None:
+            errors.append("could not list open positions")
+        if orders is None:
+            errors.append("could not list working orders")
+        jobs = []
+        for p in positions or []:
+            pos = p.get("position") or {}
+            jobs.append(("position", lambda pos=pos, p=p: self.pm.close_deal(
+                pos["dealId"], pos["direction"], pos["size"], epic=(p.get("market") or {}).get("epic"))))
+        n_positions = len(jobs)
+        for o in orders or []:
+            wod = o.get("workingOrderData") or {}
+            if wod.get("dealId"):
+                jobs.append(("order", lambda wod=wod, o=o: self.om.cancel_order(wod["dealId"], order_epic(o))))
+        logging.warning(f"FLATTEN ALL: closing {n_positions} positions, cancelling {len(jobs) - n_positions} orders")
+
+        report = {"positions": [], "orders": [], "rejected": []}
+        if jobs:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_parallel, len(jobs)))) as pool:
+                futs = [(kind, pool.submit(fn)) for kind, fn in jobs]
+                for kind, fut in futs:
+                    report["positions" if kind == "position" else "orders"].append(fut.result())
+
+        # A close is only done once its deal is confirmed ACCEPTED.
+        if self.om is not None:
+            pending = {r["dealReference"]: r for r in report["positions"] if r.get("dealReference")}
+            futs = {ref: self.om.confirms.track(ref) for ref in pending}
+            deadline = time.monotonic() + confirm_timeout
+            for ref, fut in futs.items():
+                try:
+                    conf = fut.result(max(0.0, deadline - time.monotonic()))
+                except Exception:
+                    conf = None
+                if conf is None or not conf.accepted:
+                    pending[ref]["ok"] = False
+                    pending[ref]["error"] = conf.reason if conf is not None else "confirm timeout"
+                    report["rejected"].append(pending[ref])
+
+        # Judge the outcome from the account itself, not from the per-call results.
+        positions, orders = self._snapshot_open()
+        if positions is None:
+            errors.append("could not re-list open positions")
+        if orders is None:
+            errors.append("could not re-list working orders")
+        report["remaining"] = {"positions": len(positions) if positions is not None else None,
+                               "orders": len(orders) if orders is not None else None}
+        report["errors"] = errors
+        report["flat"] = not errors and not positions and not orders
+        report["time_to_flat"] = time.monotonic() - start
+        logging.warning(f"FLATTEN ALL: {'flat' if report['flat'] else 'NOT flat'} in {report['time_to_flat']:.2f}s "
+                        f"({sum(r['ok'] for r in report['positions'])}/{len(report['positions'])} positions, "
+                        f"{sum(r['ok'] for r in report['orders'])}/{len(report['orders'])} orders, "
+                        f"remaining {report['remaining']})" + (f"; {'; '.join(errors)}" if errors else ""))
+        return report
+
+    def _snapshot_open(self):
+        """(positions, working orders) fetched fresh; either is None if its GET failed."""
+        positions = self.pm.book.refresh(strict=True)
+        if self.om is None:
+            return positions, None
+        orders = self.om.book.refresh(strict=True)
+        if orders is not None:
+            orders = [o for o in orders if (o.get("workingOrderData") or {}).get("dealId")]
+        return positions, orders
+
+    def start_streaming(self, epics: List[str]) -> bool:
+        """Subscribes epics on the price stream; prices are then read from the tick cache."""
+        if self.stream is None:
+            endpoint, user, password = self.session_handler.get_streaming_credentials()
+            if not endpoint:
+                logging.warning("No Lightstreamer endpoint from login; staying on REST prices.")
+                return False
+            self.stream = PriceStream(LightstreamerClient(endpoint, user, password))
+            self.bar_aggregator = BarAggregator()
+            self.stream.ticks.add_listener(self.bar_aggregator.on_tick)
+            self.bar_aggregator.add_listener(self.scanner.extremes.on_bar)
+            self.bar_aggregator.add_listener(self.scanner.levels.on_bar)
+            self.bar_aggregator.add_listener(self.indicators.on_bar)
+            # Bars built across a disconnect would have a hole in them; start over from REST.
+            self.stream.add_disconnect_listener(self.bar_aggregator.reset)
+            self.md.attach_tick_cache(self.stream.ticks)
+            self.md.attach_bar_aggregator(self.bar_aggregator)
+            self.bar_aggregator.start()
+            # Position changes arrive as OPU messages; updates missed while disconnected
+            # are picked up by refetching the book.
+            self.trades = TradeStream(self.stream.client, user)
+            self.trades.add_listener(self.pm.book.on_trade_update)
+            self.stream.add_disconnect_listener(self.pm.book.invalidate)
+            self.trades.subscribe()
+            self.stream.start()
+        self.stream.subscribe(epics)
+        return True
+
+    def start_trailing(self, distance: float, step: float = 1.0, min_interval: float = 1.0) -> bool:
+        """Trails every open position's stop `distance` points behind streamed prices."""
+        if self.trailing is None:
+            self.trailing = TrailingStopEngine(
+                lambda deal_id, stop, limit: self.pm.amend_position(deal_id, stop=stop, limit=limit),
+                distance, step, min_interval, min_distance=self._validator().min_stop_distance)
+        self.trailing.sync(self.pm.list_all_open_positions())
+        if not self.start_streaming(self.trailing.epics()):
+            self.trailing.shutdown()
+            self.trailing = None
+            return False
+        self.stream.ticks.remove_listener(self.trailing.on_tick)
+        self.stream.ticks.add_listener(self.trailing.on_tick)
+        return True
+
+    def _validator(self) -> PreTradeValidator:
+        if self.om is not None and self.om.validator is not None:
+            return self.om.validator
+        return PreTradeValidator(self.md)
+
+    def sync_trailing(self) -> None:
+        """Picks up newly opened or closed positions; call once per trading cycle."""
+        if self.trailing is not None and self.stream is not None:
+            self.trailing.sync(self.pm.list_all_open_positions())
+            self.stream.subscribe(self.trailing.epics())
+
+    def stop_trailing(self) -> None:
+        if self.trailing is not None:
+            if self.stream is not None:
+                self.stream.ticks.remove_listener(self.trailing.on_tick)
+            self.trailing.shutdown()
+            self.trailing = None
+
+    def stop_streaming(self) -> None:
+        self.stop_trailing()
+        if self.stream is not None:
+            self.stream.stop()
+            self.bar_aggregator.stop()
+            self.md.attach_tick_cache(None)
+            self.md.attach_bar_aggregator(None)
+            self.stream = None
+            self.trades = None
+            self.bar_aggregator = None
+
+    def coalesce_stats(self) -> Dict[str, int]:
+        return self.http.stats()
+
+    def allowance_stats(self) -> Dict:
+        return self.scheduler.stats()
+
+    def scan_watchlist(self, watchlist: List[str], fn=None, timeout: float = 10.0) -> ScanReport:
+        """
+        Runs fn(epic) (default: Scanner.is_breaking_high) across the watchlist
+        concurrently. Snapshots are bulk-fetched first; the default scan is
+        handed each epic's prefetched entry, since pacing can spread a scan
+        over longer than the snapshot cache's price TTL.
+        """
+        snaps = self.md.get_market_snapshots(watchlist)
+        fn = fn or (lambda epic: self.scanner.is_breaking_high(epic, market=snaps.get(epic)))
+        report = self.scan_executor.run(watchlist, fn, timeout=timeout)
+        logging.info(f"Scan cycle: {report.summary()}")
+        return report
+
+    def rank_watchlist(self, watchlist: List[str], timeout: float = 10.0, max_age: float = 30.0) -> pd.DataFrame:
+        """
+        Ranks the watchlist by EMA crossover then RSI from the IndicatorEngine.
+        Unseeded epics are seeded from history; seeded ones only take bars
+        newer than their last. Candle windows come from the same cache the
+        scanner fills, and one fetched less than max_age seconds ago (e.g.
+        by this cycle's scan) is reused without another /prices call.
+        """
+        ind = self.indicators
+        bars = max(200, 3 * ind.warmup_bars)
+        report = self.scan_executor.run(
+            watchlist, lambda epic: ind.update_from_frame(epic, self.get_candles(epic, ind.resolution, bars, max_age)),
+            timeout=timeout)
+        if report.failures:
+            logging.warning(f"Indicator update failed for: {', '.join(report.failures)}")
+        return ind.rank(watchlist)
+
     def get_mid_price(self, epic: str) -> Optional[float]:
         return self.md.get_mid_price(epic)
 
-    def get_candles(self, epic: str, resolution: str, max_bars: int) -> Optional[pd.DataFrame]:
-        return self.md.get_candles(epic, resolution, max_bars)
+    def get_market_snapshots(self, epics: List[str]) -> Dict[str, Dict]:
+        return self.md.get_market_snapshots(epics)
+
+    def get_candles(self, epic: str, resolution: str, max_bars: int, max_age: float = 0.0) -> Optional[pd.DataFrame]:
+        return self.md.get_candles(epic, resolution, max_bars, max_age)
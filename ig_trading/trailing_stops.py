@@ -0,0 +1,179 @@
+# This file trails position stops client-side from streamed prices.
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from data_feed.tick_cache import Tick
+
+class _Trail:
+    __slots__ = ("deal_id", "epic", "direction", "extreme", "stop", "limit", "want",
+                 "in_flight", "last_sent", "failures", "retry_at")
+
+    def __init__(self, deal_id: str, epic: str, direction: str, stop: Optional[float],
+                 limit: Optional[float], extreme: Optional[float]):
+        self.deal_id = deal_id
+        self.epic = epic
+        self.direction = direction
+        self.extreme = extreme      # high-water mark (BUY) or low-water mark (SELL)
+        self.stop = stop            # stop level IG last accepted
+        self.limit = limit
+        self.want: Optional[float] = None
+        self.in_flight = False
+        self.last_sent = 0.0
+        self.failures = 0           # consecutive failed amends
+        self.retry_at = 0.0         # no resend before this (monotonic), after failures
+
+class TrailingStopEngine:
+    """
+    Trails the stop of every tracked position `distance` points behind its
+    best price since tracking began, using the exit side of each tick (bid
+    for BUY, offer for SELL).
+
+    Ticks only update local state. A PUT is sent only when the computed stop
+    has moved at least `step` beyond the one IG holds, at most once per
+    `min_interval` per deal, and never while an amend for the same deal is
+    still in flight: the newest target simply replaces the pending one and
+    goes out on the first tick after the previous amend returns. Stops are
+    only ever tightened.
+    amend(deal_id, stop, limit) -> bool does the request; the existing limit
+    is passed through so the amend does not clear it.
+
+    After a failed amend the deal waits min_interval * 2**failures (capped
+    at max_backoff) before the next try, so a deal IG keeps rejecting
+    cannot crowd the trading allowance. If min_distance(epic) is given, a
+    position whose market's minimum stop distance exceeds `distance` is not
+    tracked at all, since every amend for it would be refused.
+    """
+    def __init__(self, amend: Callable[[str, float, Optional[float]], bool], distance: float,
+                 step: float = 1.0, min_interval: float = 1.0, max_workers: int = 4,
+                 max_backoff: float = 60.0,
+                 min_distance: Optional[Callable[[str], Optional[float]]] = None):
+        self.amend = amend
+        self.distance = float(distance)
+        self.step = float(step)
+        self.min_interval = float(min_interval)
+        self.max_backoff = float(max_backoff)
+        self.min_distance = min_distance
+        self.counts = {"ticks": 0, "sent": 0, "coalesced": 0, "failed": 0}
+        self.refused: Dict[str, str] = {}   # epic -> why its positions are not trailed
+        self._trails: Dict[str, _Trail] = {}
+        self._by_epic: Dict[str, List[_Trail]] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=int(max_workers), thread_name_prefix="trail")
+
+    def epics(self) -> List[str]:
+        with self._lock:
+            return list(self._by_epic)
+
+    def sync(self, positions: Iterable[Dict]) -> None:
+        """Tracks new positions and forgets closed ones (IG /positions payloads)."""
+        positions = list(positions)
+        # Rule lookups may hit the network, so they run before taking the lock.
+        for p in positions:
+            epic = (p.get("market") or {}).get("epic")
+            if (self.min_distance is not None and epic not in self.refused
+                    and (p.get("position") or {}).get("dealId") not in self._trails):
+                self._check_distance(epic)
+        seen = set()
+        with self._lock:
+            for p in positions:
+                pos = p.get("position") or {}
+                deal_id = pos.get("dealId")
+                if not deal_id:
+                    continue
+                seen.add(deal_id)
+                tr = self._trails.get(deal_id)
+                if tr is None and (p.get("market") or {}).get("epic") in self.refused:
+                    continue
+                if tr is None:
+                    tr = self._trails[deal_id] = _Trail(
+                        deal_id, (p.get("market") or {}).get("epic"), pos.get("direction"),
+                        pos.get("stopLevel"), pos.get("limitLevel"), pos.get("level"))
+                    self._by_epic.setdefault(tr.epic, []).append(tr)
+                elif not tr.in_flight:
+                    tr.limit = pos.get("limitLevel")
+                    if pos.get("stopLevel") is not None:
+                        tr.stop = self._tighter(tr, tr.stop, pos["stopLevel"])
+            for deal_id in [d for d in self._trails if d not in seen]:
+                tr = self._trails.pop(deal_id)
+                lst = self._by_epic.get(tr.epic, [])
+                if tr in lst:
+                    lst.remove(tr)
+                if not lst:
+                    self._by_epic.pop(tr.epic, None)
+
+    def _check_distance(self, epic: str) -> None:
+        try:
+            lo = self.min_distance(epic)
+        except Exception as e:
+            logging.error(f"Minimum stop distance lookup for {epic} failed: {e}")
+            return
+        if lo is not None and self.distance < lo:
+            self.refused[epic] = f"trail distance {self.distance} below minimum stop distance {lo}"
+            logging.warning(f"Not trailing {epic}: {self.refused[epic]}")
+
+    @staticmethod
+    def _tighter(tr: _Trail, a: Optional[float], b: Optional[float]) -> Optional[float]:
+        if a is None or b is None:
+            return b if a is None else a
+        return max(a, b) if tr.direction == "BUY" else min(a, b)
+
+    def on_tick(self, tick: Tick) -> None:
+        """TickCache listener; runs on the stream thread, so it never blocks on I/O."""
+        submit = []
+        now = time.monotonic()
+        with self._lock:
+            self.counts["ticks"] += 1
+            for tr in self._by_epic.get(tick.epic, ()):
+                price = tick.bid if tr.direction == "BUY" else tick.offer
+                if price is None:
+                    continue
+                if tr.direction == "BUY":
+                    tr.extreme = price if tr.extreme is None else max(tr.extreme, price)
+                    target = round(tr.extreme - self.distance, 2)
+                    moved = tr.stop is None or target - tr.stop >= self.step
+                else:
+                    tr.extreme = price if tr.extreme is None else min(tr.extreme, price)
+                    target = round(tr.extreme + self.distance, 2)
+                    moved = tr.stop is None or tr.stop - target >= self.step
+                if not moved:
+                    continue
+                if tr.want is not None:
+                    self.counts["coalesced"] += 1
+                tr.want = target
+                if not tr.in_flight and now - tr.last_sent >= self.min_interval and now >= tr.retry_at:
+                    tr.in_flight = True
+                    tr.last_sent = now
+                    submit.append((tr, target))
+        for tr, target in submit:
+            self._pool.submit(self._send, tr, target)
+
+    def _send(self, tr: _Trail, stop: float) -> None:
+        try:
+            ok = bool(self.amend(tr.deal_id, stop, tr.limit))
+        except Exception as e:
+            logging.error(f"Trailing stop amend for {tr.deal_id} raised: {e}")
+            ok = False
+        with self._lock:
+            tr.in_flight = False
+            if ok:
+                self.counts["sent"] += 1
+                tr.failures = 0
+                tr.retry_at = 0.0
+                tr.stop = self._tighter(tr, tr.stop, stop)
+                if tr.want == stop:
+                    tr.want = None
+            else:
+                self.counts["failed"] += 1
+                tr.failures += 1
+                delay = min(self.max_backoff, self.min_interval * (2 ** tr.failures))
+                tr.retry_at = time.monotonic() + delay
+        if ok:
+            logging.info(f"Trailed {tr.epic} {tr.deal_id} stop to {stop}")
+        else:
+            logging.warning(f"Trailing amend for {tr.deal_id} failed {tr.failures}x; next try in {delay:.1f}s")
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
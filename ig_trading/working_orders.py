@@ -0,0 +1,158 @@
+# This file caches the /workingorders list, indexed for per-epic lookups.
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+def order_type(wod: Dict) -> Optional[str]:
+    """Working order type as this code uses it (STOP_ENTRY / LIMIT_ENTRY)."""
+    t = wod.get("type")
+    if t:
+        return t
+    return {"STOP": "STOP_ENTRY", "LIMIT": "LIMIT_ENTRY"}.get(wod.get("orderType"), wod.get("orderType"))
+
+def order_epic(o: Dict) -> Optional[str]:
+    return (o.get("marketData") or {}).get("epic") or (o.get("workingOrderData") or {}).get("epic")
+
+class WorkingOrderBook:
+    """
+    Snapshot of GET /workingorders with indexes by epic, by
+    (epic, direction, type) and by dealId.
+
+    Reads refetch through `fetch` only when the snapshot is older than
+    ttl; in between, our own placements and cancels are applied locally
+    (add_local / remove) so the view stays current without extra requests.
+    Locally added orders carry only a dealReference until the next refresh.
+    """
+    def __init__(self, fetch: Callable[[], Optional[List[Dict]]], ttl: float = 3.0):
+        self.fetch = fetch
+        self.ttl = float(ttl)
+        self.fetched_at: Optional[float] = None
+        self.fetches = 0
+        self._orders: List[Dict] = []
+        self._by_epic: Dict[str, List[Dict]] = {}
+        self._by_key: Dict[Tuple[str, str, str], List[Dict]] = {}
+        self._by_deal: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+
+    def _fresh(self) -> bool:
+        return self.fetched_at is not None and time.monotonic() - self.fetched_at < self.ttl
+
+    def refresh(self, strict: bool = False) -> Optional[List[Dict]]:
+        """Refetches the book. With strict, a failed fetch returns None instead of the old view."""
+        orders = self.fetch()
+        with self._lock:
+            self.fetches += 1
+            if orders is None:
+                # Fetch failed: keep serving the old view rather than an empty book.
+                return None if strict else list(self._orders)
+            self._orders = []
+            self._by_epic.clear()
+            self._by_key.clear()
+            self._by_deal.clear()
+            for o in orders:
+                self._index(o)
+            self.fetched_at = time.monotonic()
+            return list(self._orders)
+
+    def _ensure(self, refresh: bool) -> None:
+        if refresh or not self._fresh():
+            self.refresh()
+
+    def _index(self, o: Dict) -> None:
+        wod = o.get("workingOrderData") or {}
+        epic = order_epic(o)
+        self._orders.append(o)
+        self._by_epic.setdefault(epic, []).append(o)
+        self._by_key.setdefault((epic, wod.get("direction"), order_type(wod)), []).append(o)
+        if wod.get("dealId"):
+            self._by_deal[wod["dealId"]] = o
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.fetched_at = None
+
+    def all(self, refresh: bool = False) -> List[Dict]:
+        self._ensure(refresh)
+        with self._lock:
+            return list(self._orders)
+
+    def for_epic(self, epic: str, direction: Optional[str] = None, otype: Optional[str] = None,
+                 refresh: bool = False) -> List[Dict]:
+        self._ensure(refresh)
+        with self._lock:
+            if direction is None and otype is None:
+                return list(self._by_epic.get(epic, []))
+            if direction is not None and otype is not None:
+                return list(self._by_key.get((epic, direction, otype), []))
+            return [o for o in self._by_epic.get(epic, [])
+                    if (direction is None or (o.get("workingOrderData") or {}).get("direction") == direction)
+                    and (otype is None or order_type(o.get("workingOrderData") or {}) == otype)]
+
+    def by_deal_id(self, deal_id: str) -> Optional[Dict]:
+        with self._lock:
+            return self._by_deal.get(deal_id)
+
+    def add_local(self, epic: str, direction: str, otype: str, level: float, size: float,
+                  deal_reference: Optional[str] = None, deal_id: Optional[str] = None, **extra) -> Dict:
+        o = {
+            "workingOrderData": {
+                "dealId": deal_id, "dealReference": deal_reference, "epic": epic,
+                "direction": direction, "type": otype, "orderLevel": level, "orderSize": size,
+                "local": True, **extra,
+            },
+            "marketData": {"epic": epic},
+        }
+        with self._lock:
+            self._index(o)
+        return o
+
+    def remove(self, deal_id: str) -> bool:
+        with self._lock:
+            o = self._by_deal.pop(deal_id, None)
+            if o is None:
+                return False
+            wod = o.get("workingOrderData") or {}
+            epic = order_epic(o)
+            for lst in (self._orders, self._by_epic.get(epic, []),
+                        self._by_key.get((epic, wod.get("direction"), order_type(wod)), [])):
+                _drop(lst, o)
+            return True
+
+    def remove_reference(self, deal_reference: str) -> bool:
+        """Drops a locally added order that never got a dealId (e.g. rejected)."""
+        with self._lock:
+            for o in self._orders:
+                wod = o.get("workingOrderData") or {}
+                if wod.get("dealReference") == deal_reference and not wod.get("dealId"):
+                    epic = order_epic(o)
+                    for lst in (self._orders, self._by_epic.get(epic, []),
+                                self._by_key.get((epic, wod.get("direction"), order_type(wod)), [])):
+                        _drop(lst, o)
+                    return True
+            return False
+
+    def update_level(self, deal_id: str, level: float) -> bool:
+        """Applies our own successful amend to the cached order."""
+        with self._lock:
+            o = self._by_deal.get(deal_id)
+            if o is None:
+                return False
+            o.setdefault("workingOrderData", {})["orderLevel"] = level
+            return True
+
+    def set_deal_id(self, deal_reference: str, deal_id: str) -> None:
+        """Attaches a confirmed dealId to a locally added order."""
+        with self._lock:
+            for o in self._orders:
+                wod = o.get("workingOrderData") or {}
+                if wod.get("dealReference") == deal_reference and not wod.get("dealId"):
+                    wod["dealId"] = deal_id
+                    self._by_deal[deal_id] = o
+                    return
+
+def _drop(lst: List[Dict], o: Dict) -> None:
+    # Identity, not equality: two orders can have identical fields.
+    for i, x in enumerate(lst):
+        if x is o:
+            del lst[i]
+            return
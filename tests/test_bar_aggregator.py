@@ -0,0 +1,88 @@
+# Checks when locally aggregated bars may stand in for the REST price window.
+import os
+import sys
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_feed.bar_aggregator import BarAggregator
+from data_feed.market_data import MarketData
+
+EPIC = "IX.D.FTSE.DAILY.IP"
+
+def candle(ts: float, close: float) -> dict:
+    px = {"bid": close, "ask": close + 1.0}
+    return {"snapshotTimeUTC": datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+            "openPrice": px, "highPrice": px, "lowPrice": px, "closePrice": px, "lastTradedVolume": 1}
+
+class _Response:
+    status_code = 200
+    text = ""
+
+    def __init__(self, prices):
+        self._prices = prices
+
+    def json(self):
+        return {"prices": self._prices}
+
+class _PricesSession:
+    def __init__(self, now: float, n: int = 60):
+        self.series = [candle(now - (n - 1 - i) * 60, 7500.0 + i) for i in range(n)]
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        if "max_points=" in url:
+            return _Response(self.series[-int(url.rsplit("max_points=", 1)[1]):])
+        return _Response(self.series[-1:])
+
+class BarAggregatorGapTest(unittest.TestCase):
+    def setUp(self):
+        self.now = time.time()
+        self.minute = self.now - self.now % 60
+        self.agg = BarAggregator(["MINUTE"])
+
+    def test_hole_between_seed_and_live_bars_goes_to_rest(self):
+        # History seeded half an hour ago, then the stream only starts now.
+        self.agg.seed(EPIC, "MINUTE", [candle(self.minute - (50 - i) * 60, 7400.0 + i) for i in range(20)])
+        self.agg.add_tick(EPIC, 7600.0, 7601.0, self.now)
+        self.assertGreaterEqual(self.agg.count(EPIC, "MINUTE"), 20)
+        self.assertFalse(self.agg.contiguous(EPIC, "MINUTE", 20))
+
+        session = _PricesSession(self.minute)
+        md = MarketData(session, {}, "x")
+        md.attach_bar_aggregator(self.agg)
+        window = md.get_price_window(EPIC, "MINUTE", 20)
+        self.assertEqual(session.calls, 1)
+        self.assertEqual(window[0], session.series[-20])
+
+        # The REST window re-seeded the aggregator up to the live bar, so it takes over.
+        self.assertTrue(self.agg.contiguous(EPIC, "MINUTE", 20))
+        window = md.get_price_window(EPIC, "MINUTE", 20)
+        self.assertEqual(session.calls, 1)
+        self.assertEqual(window[-1]["closePrice"]["bid"], 7600.0)
+
+    def test_reset_after_disconnect_forces_rest(self):
+        self.agg.seed(EPIC, "MINUTE", [candle(self.minute - (20 - i) * 60, 7400.0 + i) for i in range(20)])
+        self.agg.add_tick(EPIC, 7600.0, 7601.0, self.now)
+        self.assertTrue(self.agg.contiguous(EPIC, "MINUTE", 20))
+        self.agg.reset()
+        self.assertEqual(self.agg.count(EPIC, "MINUTE"), 0)
+        self.assertFalse(self.agg.contiguous(EPIC, "MINUTE", 20))
+
+    def test_quiet_bar_closes_on_timer(self):
+        closed = threading.Event()
+        self.agg.add_listener(lambda epic, res, c: closed.set())
+        self.agg.add_tick(EPIC, 7600.0, 7601.0, self.minute - 30)  # last tick was in the previous minute
+        self.agg.start(interval=0.05)
+        try:
+            self.assertTrue(closed.wait(2.0))
+        finally:
+            self.agg.stop()
+        self.assertEqual(self.agg.count(EPIC, "MINUTE"), 1)
+
+if __name__ == "__main__":
+    unittest.main()
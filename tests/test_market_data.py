@@ -0,0 +1,62 @@
+# Checks how often MarketData.get_price_window goes back to /prices.
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_feed.market_data import MarketData
+
+def candle(t: datetime, close: float) -> dict:
+    px = {"bid": close, "ask": close + 1.0, "lastTraded": None}
+    return {"snapshotTimeUTC": t.strftime("%Y-%m-%dT%H:%M:%S"), "openPrice": px, "highPrice": px,
+            "lowPrice": px, "closePrice": px, "lastTradedVolume": 10}
+
+class _Response:
+    def __init__(self, prices):
+        self.status_code = 200
+        self.text = ""
+        self._prices = prices
+
+    def json(self):
+        return {"prices": self._prices}
+
+class _PricesSession:
+    """Serves a minute series that ended `age` ago, as /prices does for a closed market."""
+    def __init__(self, age: timedelta, n: int = 300):
+        end = datetime.utcnow().replace(second=0, microsecond=0) - age
+        self.series = [candle(end - timedelta(minutes=n - 1 - i), 7500.0 + i) for i in range(n)]
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        if "max_points=" in url:
+            n = int(url.rsplit("max_points=", 1)[1])
+            self.calls.append(("window", n))
+            return _Response(self.series[-n:])
+        self.calls.append(("tail", None))
+        return _Response(self.series[-1:])
+
+class PriceWindowTest(unittest.TestCase):
+    def test_closed_market_is_not_downloaded_again(self):
+        session = _PricesSession(age=timedelta(days=2))
+        md = MarketData(session, {}, "x")
+        windows = [md.get_price_window("IX.D.FTSE.DAILY.IP", "MINUTE", 200) for _ in range(4)]
+        self.assertEqual([k for k, _ in session.calls].count("window"), 1)
+        self.assertLessEqual(len(session.calls), 2)
+        for w in windows:
+            self.assertEqual(len(w), 200)
+            self.assertEqual(w[-1], session.series[-1])
+
+    def test_forming_bar_keeps_being_refreshed(self):
+        session = _PricesSession(age=timedelta(0))
+        md = MarketData(session, {}, "x")
+        md.get_price_window("IX.D.FTSE.DAILY.IP", "MINUTE", 200)
+        for i in range(3):
+            session.series[-1] = candle(datetime.utcnow().replace(second=0, microsecond=0), 7600.0 + i)
+            w = md.get_price_window("IX.D.FTSE.DAILY.IP", "MINUTE", 200)
+            self.assertEqual(w[-1]["closePrice"]["bid"], 7600.0 + i)
+        self.assertEqual([k for k, _ in session.calls], ["window", "tail", "tail", "tail"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+# Checks that ScanExecutor timeouts leave out time spent waiting for request allowance.
+import os
+import sys
+import time
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ig_trading.scan_executor import ScanExecutor
+from utils.rate_limiter import RequestScheduler
+
+class _Response:
+    status_code = 200
+    text = ""
+
+    def json(self):
+        return {}
+
+class _Session:
+    def get(self, url, **kwargs):
+        time.sleep(0.02)
+        return _Response()
+
+class ThrottledScanTest(unittest.TestCase):
+    def setUp(self):
+        # One token up front, then ten a second: 12 epics take over a second to get through.
+        self.scheduler = RequestScheduler(_Session(), non_trading_per_min=601, headroom=1.0, burst=1)
+        self.executor = ScanExecutor(max_workers=12, wait_clock=self.scheduler.thread_wait)
+        self.epics = [f"EPIC{i}" for i in range(12)]
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_waiting_for_allowance_is_not_a_timeout(self):
+        report = self.executor.run(self.epics, lambda epic: self.scheduler.get(f"/markets/{epic}").status_code,
+                                   timeout=0.3)
+        self.assertGreater(report.cycle_time, 0.9)
+        self.assertEqual(report.failures, {})
+        self.assertEqual(set(report.values), set(self.epics))
+        self.assertGreater(self.scheduler.stats()["non_trading_wait_s"], 0.0)
+
+    def test_slow_work_still_times_out(self):
+        def slow(epic):
+            self.scheduler.get(f"/markets/{epic}")
+            if epic == "EPIC11":
+                time.sleep(0.6)
+            return epic
+
+        report = self.executor.run(self.epics, slow, timeout=0.3)
+        self.assertEqual(report.failures, {"EPIC11": "timeout"})
+        self.assertEqual(len(report.values), 11)
+
+    def test_without_wait_clock_queueing_counts(self):
+        executor = ScanExecutor(max_workers=12)
+        try:
+            report = executor.run(self.epics, lambda epic: self.scheduler.get(f"/markets/{epic}"), timeout=0.3)
+        finally:
+            executor.shutdown()
+        self.assertIn("timeout", report.failures.values())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+# Exercises the streaming client against the local stand-in server.
+import json
+import os
+import sys
+import time
+import unittest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_feed.stream_server import LocalStreamServer
+from data_feed.streaming import LightstreamerClient, PriceStream, TradeStream
+from data_feed.tick_cache import TickCache
+from ig_trading.position_book import PositionBook
+
+EPIC = "IX.D.FTSE.DAILY.IP"
+ITEM = f"MARKET:{EPIC}"
+
+def wait_for(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if cond():
+            return True
+        time.sleep(0.02)
+    return False
+
+class PriceStreamReconnectTest(unittest.TestCase):
+    def setUp(self):
+        self.server = LocalStreamServer(probe_interval=0.2).start()
+        self.client = LightstreamerClient(self.server.url, "user", "pass",
+                                          reconnect_delay=0.05, read_timeout=2.0)
+        self.stream = PriceStream(self.client)
+
+    def tearDown(self):
+        self.stream.stop()
+        self.server.stop()
+
+    def test_subscribe_push_drop_resubscribe(self):
+        self.stream.subscribe([EPIC])
+        self.stream.start()
+        self.assertTrue(wait_for(lambda: self.server.subscribed(ITEM)))
+
+        self.server.push(ITEM, {"BID": "7500.1", "OFFER": "7501.1", "MARKET_STATE": "TRADEABLE"})
+        self.assertTrue(wait_for(lambda: self.stream.ticks.get(EPIC) is not None))
+        tick = self.stream.ticks.get(EPIC)
+        self.assertEqual((tick.bid, tick.offer), (7500.1, 7501.1))
+
+        # Disconnect: cached prices must go stale, then the client reconnects
+        # and re-sends the subscription on the new session by itself.
+        self.server.drop_sessions()
+        self.assertTrue(wait_for(lambda: self.stream.ticks.get(EPIC) is None))
+        self.assertTrue(wait_for(lambda: self.server.sessions_created >= 2 and self.server.subscribed(ITEM)))
+        self.assertGreaterEqual(self.client.reconnects, 1)
+
+        self.server.push(ITEM, {"BID": "7502.5", "OFFER": "7503.5"})
+        self.assertTrue(wait_for(lambda: self.stream.ticks.get(EPIC) is not None))
+        self.assertEqual(self.stream.ticks.get(EPIC).bid, 7502.5)
+
+    def test_trade_updates_reach_position_book(self):
+        book = PositionBook(lambda: None, ttl=3600.0)
+        trades = TradeStream(self.client, "ACC1")
+        trades.add_listener(book.on_trade_update)
+        trades.subscribe()
+        self.stream.start()
+        self.assertTrue(wait_for(lambda: self.server.subscribed("TRADE:ACC1")))
+
+        opu = {"dealId": "DEAL1", "epic": EPIC, "status": "OPEN", "direction": "BUY", "size": 1, "level": 7500.0}
+        self.server.push("TRADE:ACC1", {"OPU": json.dumps(opu)})
+        self.assertTrue(wait_for(lambda: book.by_deal_id("DEAL1") is not None))
+        self.server.push("TRADE:ACC1", {"OPU": json.dumps({**opu, "status": "DELETED"})})
+        self.assertTrue(wait_for(lambda: book.by_deal_id("DEAL1") is None))
+
+class TickCacheStalenessTest(unittest.TestCase):
+    def test_quiet_tick_stays_current_until_marked_stale(self):
+        ticks = TickCache()
+        ticks.update(EPIC, 7500.1, 7501.1, ts=time.time() - 600)
+        self.assertIsNotNone(ticks.get(EPIC))
+        self.assertIsNone(ticks.get(EPIC, max_age=5.0))
+        ticks.mark_stale(EPIC)
+        self.assertIsNone(ticks.get(EPIC))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+# This file provides single-flight coalescing of identical concurrent GETs.
+import threading
+from typing import Dict, Optional
+
+class _Call:
+    __slots__ = ("event", "response", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error: Optional[BaseException] = None
+
+class CoalescingSession:
+    """
+    Wraps a requests.Session so that identical GETs in flight at the same
+    time share one HTTP call and its Response. Everything other than get()
+    is passed straight through to the wrapped session.
+
+    The key is the URL, query params and headers, so calls with different
+    API versions or auth tokens are never merged. Streaming GETs are not
+    coalesced, since their body can only be read once.
+    """
+    def __init__(self, session):
+        self.session = session
+        self._inflight: Dict[tuple, _Call] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    @staticmethod
+    def _key(url, kwargs) -> tuple:
+        params = kwargs.get("params") or {}
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        headers = tuple(sorted((kwargs.get("headers") or {}).items()))
+        rest = tuple(sorted((k, repr(v)) for k, v in kwargs.items() if k not in ("params", "headers")))
+        return (url, params, headers, rest)
+
+    def get(self, url, **kwargs):
+        if kwargs.get("stream"):
+            return self.session.get(url, **kwargs)
+        key = self._key(url, kwargs)
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+                self.requests += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.response
+        try:
+            call.response = self.session.get(url, **kwargs)
+            # Read the body now so followers can call .json() without racing on the socket.
+            call.response.content
+            return call.response
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"requests": self.requests, "coalesced": self.coalesced,
+                    "in_flight": len(self._inflight)}
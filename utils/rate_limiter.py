@@ -0,0 +1,184 @@
+# This file keeps REST traffic inside IG's published request allowances.
+import re
+import threading
+import time
+import logging
+from typing import Dict, Optional
+
+from requests import RequestException
+
+# Calls that count against the per-account trading allowance.
+_TRADING_PATH = re.compile(r"/(positions|workingorders)/otc(/|$|\?)")
+
+class AllowanceExhausted(RequestException):
+    """Raised instead of sending a request the allowance can no longer cover."""
+
+class TokenBucket:
+    """Classic token bucket; acquire() blocks (FIFO-ish) until a token is free."""
+    def __init__(self, rate_per_min: float, capacity: Optional[float] = None):
+        self.rate = float(rate_per_min) / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_min)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.cond = threading.Condition()
+        self.waited = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        start = time.monotonic()
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    self.waited += now - start
+                    return True
+                wait = (1.0 - self.tokens) / self.rate
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait = min(wait, deadline - now)
+                self.cond.wait(wait)
+
+    def drain(self, seconds: float = 60.0) -> None:
+        """Empties the bucket (and pushes refill back) after the server says we are over."""
+        with self.cond:
+            self.tokens = -self.rate * seconds
+            self.updated = time.monotonic()
+
+    def remaining(self) -> float:
+        with self.cond:
+            self._refill(time.monotonic())
+            return self.tokens
+
+class RequestScheduler:
+    """
+    Wraps a requests.Session and makes every get/post/put/delete wait for a
+    token from the matching bucket: trading (order and position changes) or
+    non-trading (everything else). /prices responses carry the weekly
+    historical-data allowance, which is tracked here; once it drops to
+    history_reserve points further /prices calls raise AllowanceExhausted
+    until the allowance expiry passes. A 403 "exceeded" reply drains the
+    relevant bucket so the next minute is spent waiting, not failing.
+    """
+    def __init__(self, session, trading_per_min: float = 100, non_trading_per_min: float = 60,
+                 headroom: float = 0.9, burst: int = 10, history_reserve: int = 200,
+                 timeout: Optional[float] = 120.0):
+        self.session = session
+        # IG counts requests over a rolling minute, so burst plus one minute of
+        # refill must stay under the limit.
+        self.trading = TokenBucket(trading_per_min * headroom - burst, burst)
+        self.non_trading = TokenBucket(non_trading_per_min * headroom - burst, burst)
+        self.history_reserve = int(history_reserve)
+        self.timeout = timeout
+        self.history_remaining: Optional[int] = None
+        self.history_total: Optional[int] = None
+        self.history_reset_at: Optional[float] = None
+        self.sent = {"trading": 0, "non_trading": 0}
+        self.rejected = 0
+        self._lock = threading.Lock()
+        # Per-thread time spent waiting for a token, so callers can leave it out of their timeouts.
+        self._thread_wait: Dict[int, float] = {}
+        self._waiting_since: Dict[int, float] = {}
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def _bucket(self, method: str, url: str):
+        if method != "GET" and _TRADING_PATH.search(url):
+            return "trading", self.trading
+        return "non_trading", self.non_trading
+
+    def _history_blocked(self) -> bool:
+        with self._lock:
+            if self.history_remaining is None:
+                return False
+            if self.history_reset_at is not None and time.time() >= self.history_reset_at:
+                self.history_remaining = None
+                return False
+            return self.history_remaining <= self.history_reserve
+
+    def _note_response(self, kind: str, url: str, r) -> None:
+        if "/prices/" in url and getattr(r, "status_code", None) == 200:
+            try:
+                body = r.json() or {}
+                # /prices v3 nests it under metadata; v1/v2 put it at the top level.
+                allowance = (body.get("metadata") or {}).get("allowance") or body.get("allowance") or {}
+            except ValueError:
+                allowance = {}
+            if "remainingAllowance" in allowance:
+                with self._lock:
+                    self.history_remaining = int(allowance["remainingAllowance"])
+                    self.history_total = allowance.get("totalAllowance")
+                    if allowance.get("allowanceExpiry") is not None:
+                        self.history_reset_at = time.time() + float(allowance["allowanceExpiry"])
+        elif getattr(r, "status_code", None) == 403 and "exceeded" in (getattr(r, "text", "") or ""):
+            logging.warning(f"IG allowance exceeded ({kind}): {r.text}")
+            with self._lock:
+                self.rejected += 1
+            if "historical-data" in r.text:
+                with self._lock:
+                    self.history_remaining = 0
+            else:
+                (self.trading if kind == "trading" else self.non_trading).drain()
+
+    def request(self, method: str, url: str, **kwargs):
+        method = method.upper()
+        kind, bucket = self._bucket(method, url)
+        if "/prices/" in url and self._history_blocked():
+            raise AllowanceExhausted(f"Historical data allowance at {self.history_remaining} points; not requesting {url}")
+        ident = threading.get_ident()
+        t0 = time.monotonic()
+        with self._lock:
+            self._waiting_since[ident] = t0
+        try:
+            granted = bucket.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                del self._waiting_since[ident]
+                self._thread_wait[ident] = self._thread_wait.get(ident, 0.0) + time.monotonic() - t0
+        if not granted:
+            raise AllowanceExhausted(f"Timed out waiting for {kind} request allowance")
+        with self._lock:
+            self.sent[kind] += 1
+        r = getattr(self.session, method.lower())(url, **kwargs)
+        if not kwargs.get("stream"):
+            self._note_response(kind, url, r)
+        return r
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def thread_wait(self, ident: int) -> float:
+        """Seconds thread `ident` has spent waiting for allowance so far, including a wait in progress."""
+        with self._lock:
+            waited = self._thread_wait.get(ident, 0.0)
+            since = self._waiting_since.get(ident)
+        return waited + (time.monotonic() - since if since is not None else 0.0)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sent": dict(self.sent),
+                "rejected": self.rejected,
+                "trading_tokens": round(self.trading.remaining(), 2),
+                "non_trading_tokens": round(self.non_trading.remaining(), 2),
+                "trading_wait_s": round(self.trading.waited, 3),
+                "non_trading_wait_s": round(self.non_trading.waited, 3),
+                "history_remaining": self.history_remaining,
+                "history_total": self.history_total,
+            }
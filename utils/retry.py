@@ -0,0 +1,31 @@
+# This file retries REST calls that failed for transient reasons.
+import time
+import logging
+from typing import Callable, Optional, Tuple
+
+from requests import RequestException
+
+# Statuses worth another attempt: throttling and gateway/server hiccups.
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+def send_with_retry(send: Callable[[], object], attempts: int = 3, backoff: float = 0.25,
+                    label: str = "") -> Tuple[Optional[object], int, Optional[str]]:
+    """
+    Calls send() until it returns a non-transient response or attempts run
+    out, sleeping backoff * 2**n between tries. Network errors count as
+    transient. Returns (last response or None, attempts used, last error).
+    """
+    r, error = None, None
+    for n in range(1, attempts + 1):
+        try:
+            r = send()
+            error = None
+            if getattr(r, "status_code", None) not in TRANSIENT_STATUS:
+                return r, n, None
+            error = f"HTTP {r.status_code}"
+        except RequestException as e:
+            r, error = None, str(e)
+        if n < attempts:
+            logging.info(f"Retrying {label} after {error} (attempt {n}/{attempts})")
+            time.sleep(backoff * (2 ** (n - 1)))
+    return r, attempts, error